@@ -0,0 +1,149 @@
+"""
+Response cache for PDFsaver LLM calls
+In-memory LRU, optionally backed by a SQLite file so cached responses survive restarts
+"""
+
+import os
+import json
+import time
+import hashlib
+import logging
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Optional, Protocol, Tuple
+
+# Cache configuration
+LLM_CACHE_SIZE = int(os.getenv("LLM_CACHE_SIZE", "512"))  # Max in-memory entries
+LLM_CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", "86400"))  # Seconds (default 1 day)
+LLM_CACHE_DIR = os.getenv("LLM_CACHE_DIR", "")  # Set to enable the SQLite backend
+
+logger = logging.getLogger(__name__)
+
+
+class CacheBackend(Protocol):
+    """Minimal interface shared by all cache backends"""
+
+    def get(self, key: str) -> Optional[str]:
+        ...
+
+    def set(self, key: str, value: str, ttl: int = LLM_CACHE_TTL) -> None:
+        ...
+
+
+class MemoryCache:
+    """Size-capped LRU cache with per-entry expiry"""
+
+    def __init__(self, max_entries: int = LLM_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: str, ttl: int = LLM_CACHE_TTL) -> None:
+        with self._lock:
+            self._entries[key] = (time.time() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+class SQLiteCache:
+    """
+    File-backed cache stored at <cache_dir>/llm.sqlite
+    Expired rows are purged on open and every purge_every writes, so the file stays bounded
+    """
+
+    def __init__(self, cache_dir: str, purge_every: int = 256):
+        os.makedirs(cache_dir, exist_ok=True)
+        self._conn = sqlite3.connect(os.path.join(cache_dir, "llm.sqlite"), check_same_thread=False)
+        self._lock = threading.Lock()
+        self.purge_every = purge_every
+        self._writes = 0
+        with self._lock:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache "
+                "(key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS llm_cache_expires_at ON llm_cache (expires_at)")
+            self._purge_expired()
+            self._conn.commit()
+
+    def _purge_expired(self) -> None:
+        """Delete expired rows (caller holds the lock and commits)"""
+        self._conn.execute("DELETE FROM llm_cache WHERE expires_at <= ?", (time.time(),))
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM llm_cache WHERE key = ? AND expires_at > ?",
+                (key, time.time())
+            ).fetchone()
+        return row[0] if row else None
+
+    def set(self, key: str, value: str, ttl: int = LLM_CACHE_TTL) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, value, time.time() + ttl)
+            )
+            self._writes += 1
+            if self._writes % self.purge_every == 0:
+                self._purge_expired()
+            self._conn.commit()
+
+
+class TieredCache:
+    """Memory LRU in front of a persistent backend"""
+
+    def __init__(self, memory: MemoryCache, persistent: CacheBackend):
+        self.memory = memory
+        self.persistent = persistent
+
+    def get(self, key: str) -> Optional[str]:
+        value = self.memory.get(key)
+        if value is None:
+            value = self.persistent.get(key)
+            if value is not None:
+                self.memory.set(key, value)
+        return value
+
+    def set(self, key: str, value: str, ttl: int = LLM_CACHE_TTL) -> None:
+        self.memory.set(key, value, ttl)
+        self.persistent.set(key, value, ttl)
+
+
+_llm_cache: Optional[CacheBackend] = None
+
+
+def get_llm_cache() -> CacheBackend:
+    """Return the process-wide LLM response cache"""
+    global _llm_cache
+    if _llm_cache is None:
+        memory = MemoryCache()
+        if LLM_CACHE_DIR:
+            try:
+                _llm_cache = TieredCache(memory, SQLiteCache(LLM_CACHE_DIR))
+            except (OSError, sqlite3.Error) as e:
+                logger.warning("LLM cache: SQLite backend unavailable (%s), using memory only", e)
+                _llm_cache = memory
+        else:
+            _llm_cache = memory
+    return _llm_cache
+
+
+def make_cache_key(provider: str, model: str, max_tokens: int, prompt: str, system: str = "", json_mode: bool = False, version: str = "") -> str:
+    """Deterministic cache key for an LLM request"""
+    raw = json.dumps({"p": provider, "m": model, "t": max_tokens, "s": system, "j": json_mode, "q": prompt, "v": version}, sort_keys=True)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
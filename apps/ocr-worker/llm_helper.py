@@ -4,9 +4,33 @@ Supports Ollama (local), DeepSeek API, and OpenAI/GPT-5 Nano API for document cl
 """
 
 import os
+import re
 import json
+import atexit
+import asyncio
+import hashlib
+import logging
+import time
+import random
+import threading
+import warnings
+import weakref
 import httpx  # type: ignore
-from typing import Optional, Dict, Any, List
+from bisect import bisect_right
+from collections import Counter
+from datetime import datetime
+from functools import lru_cache
+from typing import Optional, Dict, Any, List, Tuple
+
+from llm_cache import get_llm_cache, make_cache_key
+
+# orjson is much faster than the stdlib for the large prompt payloads; fall back if missing
+try:
+    import orjson  # type: ignore
+except ImportError:
+    orjson = None
+
+logger = logging.getLogger(__name__)
 
 # LLM Provider configuration
 LLM_PROVIDER = os.getenv("LLM_PROVIDER", "ollama").lower()  # "ollama", "deepseek", or "openai"
@@ -14,7 +38,17 @@ USE_LLM = os.getenv("USE_LLM", "false").lower() == "true"
 
 # Ollama configuration
 OLLAMA_URL = os.getenv("OLLAMA_URL", "http://localhost:11434")
-OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "llama3")  # Default model
+# Default model: 4-bit, since local decode is memory-bandwidth bound (GPU hosts may prefer a q8_0 tag)
+OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "qwen2.5:7b-instruct-q4_K_M")
+# Constrain JSON replies to the expected schema (Ollama 0.5+); "false" falls back to plain JSON mode
+OLLAMA_JSON_SCHEMA = os.getenv("OLLAMA_JSON_SCHEMA", "true").lower() == "true"
+# Context window: the combined rules (~1.6k tokens) plus a document sample and reply overflow
+# Ollama's old 2048 default. Keep it fixed: a per-request change makes Ollama reload the model
+OLLAMA_NUM_CTX = int(os.getenv("OLLAMA_NUM_CTX", "4096"))
+# CPU threads for inference; unset lets Ollama choose (it uses the physical cores)
+OLLAMA_NUM_THREAD = int(os.getenv("OLLAMA_NUM_THREAD", "0"))
+# How long Ollama keeps the model loaded after a request (its own default is 5m)
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
 
 # DeepSeek API configuration
 DEEPSEEK_API_KEY = os.getenv("DEEPSEEK_API_KEY", "")
@@ -26,25 +60,282 @@ OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")
 OPENAI_API_URL = os.getenv("OPENAI_API_URL", "https://api.openai.com/v1/chat/completions")
 OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-5-nano")  # Default model
 
+# Optional small routing model (same provider): it only classifies the document and
+# the per-type regexes read issuer/date; the main model runs when that is not enough
+LLM_ROUTER_MODEL = os.getenv("LLM_ROUTER_MODEL", "")
+LLM_ROUTER_MAX_TOKENS = int(os.getenv("LLM_ROUTER_MAX_TOKENS", "50"))
+
+# Documents per request for extract_with_llm_packed (bounded by the model's context window)
+LLM_PACK_SIZE = int(os.getenv("LLM_PACK_SIZE", "4"))
+# Coalesce concurrent async combined calls arriving within this window (ms) into packed
+# requests of up to LLM_PACK_SIZE documents; 0 disables batching
+LLM_BATCH_WINDOW_MS = float(os.getenv("LLM_BATCH_WINDOW_MS", "0"))
+# Trim each document sample to this many tokens instead of max_chars (needs tiktoken;
+# cl100k_base is close enough to the local models' tokenizers for sizing); 0 disables
+LLM_TOKEN_BUDGET = int(os.getenv("LLM_TOKEN_BUDGET", "0"))
+
+# How long (seconds) an Ollama availability probe result is reused
+LLM_AVAILABILITY_TTL = float(os.getenv("LLM_AVAILABILITY_TTL", "60"))
+
+# Maximum number of concurrent LLM requests issued by the async helpers. For Ollama this
+# defaults to the server's parallel slots (OLLAMA_NUM_PARALLEL): more only queues server-side
+LLM_MAX_CONCURRENCY = int(os.getenv(
+    "LLM_MAX_CONCURRENCY", os.getenv("OLLAMA_NUM_PARALLEL", "4") if LLM_PROVIDER == "ollama" else "16"
+))
+
+# Retries for transient provider failures (rate limits, gateway/server errors, dropped connections)
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))
+LLM_RETRY_MAX_DELAY = float(os.getenv("LLM_RETRY_MAX_DELAY", "30"))
+_RETRY_STATUS_CODES = frozenset((429, 500, 502, 503, 504))
+# Only failures where the request never ran (or the connection dropped) are retried; a
+# ReadTimeout means the model was generating, and re-running it only multiplies the load
+_RETRY_TRANSPORT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout, httpx.RemoteProtocolError)
+
+# Circuit breaker: after LLM_BREAKER_THRESHOLD failed calls in a row, skip the LLM for
+# LLM_BREAKER_COOLDOWN seconds instead of paying the timeouts and retries per document
+LLM_BREAKER_THRESHOLD = int(os.getenv("LLM_BREAKER_THRESHOLD", "3"))
+LLM_BREAKER_COOLDOWN = float(os.getenv("LLM_BREAKER_COOLDOWN", "60"))
+_BREAKER: Dict[str, Any] = {"fails": 0, "open_until": float("-inf")}
+
+# Stream JSON-mode replies and stop reading once the first JSON object is complete.
+# On by default for Ollama: closing the stream stops the local decode, which in JSON
+# mode can otherwise run on with trailing whitespace until num_predict
+LLM_STREAM = os.getenv("LLM_STREAM", "true" if LLM_PROVIDER == "ollama" else "false").lower() == "true"
+
+# Shared HTTP clients: reuse TCP/TLS connections across LLM calls instead of
+# paying a fresh handshake for every document. With HTTP/2 the hosted APIs
+# multiplex concurrent requests over one connection; keep it open between bursts.
+_HTTP_LIMITS = httpx.Limits(max_keepalive_connections=20, max_connections=100, keepalive_expiry=120.0)
+# Fail fast on an unreachable host instead of waiting out the full read timeout on every retry
+_LLM_TIMEOUT = httpx.Timeout(30.0, connect=5.0)
+_CLIENT: Optional[httpx.Client] = None
+# The async client and the concurrency semaphore are bound to the event loop that first
+# uses them, so each running loop gets its own (a later asyncio.run() starts a new loop)
+_ASYNC_CLIENTS: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
+_LLM_SEMAPHORES: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = weakref.WeakKeyDictionary()
+
+# Async LLM requests currently in flight, keyed by a hash of the request
+_INFLIGHT: Dict[str, "asyncio.Future[Optional[str]]"] = {}
+
+# Last Ollama availability probe (monotonic timestamp and result); the lock lets
+# only one thread probe when it expires while the others wait for its result
+_AVAIL_CACHE: Dict[str, Any] = {"ts": float("-inf"), "ok": False}
+_AVAIL_LOCK = threading.Lock()
+# Async probes wait on a per-loop lock instead, so they never block the event loop
+_AVAIL_ASYNC_LOCKS: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Lock]" = weakref.WeakKeyDictionary()
+
+# Token limits: DeepSeek and Ollama don't use reasoning tokens, GPT-5 Nano does
+# For DeepSeek/Ollama: the JSON object is well under 100 tokens; 256 leaves headroom
+# For GPT-5 Nano: 1500 tokens needed (400-500 reasoning + 800-1000 content)
+_JSON_MAX_TOKENS = 1500 if LLM_PROVIDER == "openai" else 256
+# When the document type can be guessed up front, budget only what its JSON needs
+# (plus GPT-5 Nano's reasoning allowance); a truncated reply is retried with 2x
+_REASONING_TOKENS = 700 if LLM_PROVIDER == "openai" else 0
+_OUTPUT_TOKENS = {
+    "BuyContract": 128,
+    "SellContract": 128,
+    "DividendStatement": 128,
+    "DistributionStatement": 128,
+    "FinancialStatement": 192
+}
+_FILENAME_TOKENS = 64
+
+
+def _json_dumps(obj: Any) -> bytes:
+    """Serialize a request payload to JSON bytes"""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj).encode("utf-8")
+
+
+def _json_loads(data: bytes) -> Any:
+    """Deserialize a JSON response body"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def _get_client() -> httpx.Client:
+    """Return the shared HTTP client, creating it on first use"""
+    global _CLIENT
+    if _CLIENT is None:
+        _CLIENT = httpx.Client(http2=True, limits=_HTTP_LIMITS, timeout=_LLM_TIMEOUT)
+    return _CLIENT
+
+
+def _get_async_client() -> httpx.AsyncClient:
+    """Return the running loop's shared async HTTP client, creating it on first use"""
+    loop = asyncio.get_running_loop()
+    client = _ASYNC_CLIENTS.get(loop)
+    if client is None:
+        client = _ASYNC_CLIENTS[loop] = httpx.AsyncClient(http2=True, limits=_HTTP_LIMITS, timeout=_LLM_TIMEOUT)
+    return client
+
+
+def _get_llm_semaphore() -> asyncio.Semaphore:
+    """Return the running loop's LLM_MAX_CONCURRENCY semaphore"""
+    loop = asyncio.get_running_loop()
+    semaphore = _LLM_SEMAPHORES.get(loop)
+    if semaphore is None:
+        semaphore = _LLM_SEMAPHORES[loop] = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+    return semaphore
+
+
+def _get_avail_lock() -> asyncio.Lock:
+    """Return the running loop's availability-probe lock"""
+    loop = asyncio.get_running_loop()
+    lock = _AVAIL_ASYNC_LOCKS.get(loop)
+    if lock is None:
+        lock = _AVAIL_ASYNC_LOCKS[loop] = asyncio.Lock()
+    return lock
+
+
+def close_llm_client() -> None:
+    """Close the shared sync HTTP client (registered to run at interpreter exit)"""
+    global _CLIENT
+    if _CLIENT is not None:
+        _CLIENT.close()
+        _CLIENT = None
+
+
+async def aclose_llm_client() -> None:
+    """Close the running loop's async HTTP client (call from the app shutdown hook)"""
+    client = _ASYNC_CLIENTS.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+
+atexit.register(close_llm_client)
+
+# API roots (without /chat/completions) for the hosted providers
+_OPENAI_BASE_URL = OPENAI_API_URL.rsplit("/chat/completions", 1)[0]
+_DEEPSEEK_BASE_URL = DEEPSEEK_API_URL.rsplit("/chat/completions", 1)[0]
+
+
+# Chat endpoints and request headers per provider, built once (URLs and keys are fixed at import)
+_DEEPSEEK_CHAT_URL = DEEPSEEK_API_URL or "https://api.deepseek.com/v1/chat/completions"
+if not _DEEPSEEK_CHAT_URL.startswith(("http://", "https://")):
+    # If URL doesn't have protocol, add https://
+    _DEEPSEEK_CHAT_URL = f"https://{_DEEPSEEK_CHAT_URL}"
+_OLLAMA_CHAT_URL = f"{OLLAMA_URL}/api/chat"
+_DEEPSEEK_HEADERS = {
+    "Authorization": f"Bearer {DEEPSEEK_API_KEY}",
+    "Content-Type": "application/json",
+    "X-Data-Usage-Opt-Out": "true"  # Opt out of data retention and training
+}
+_OPENAI_HEADERS = {
+    "Authorization": f"Bearer {OPENAI_API_KEY}",
+    "Content-Type": "application/json"
+}
+_OLLAMA_HEADERS = {"Content-Type": "application/json"}
+# Sampling options shared by every Ollama request; num_predict is added per call
+_OLLAMA_OPTIONS: Dict[str, Any] = {"temperature": 0.1, "num_ctx": OLLAMA_NUM_CTX}
+if OLLAMA_NUM_THREAD > 0:
+    _OLLAMA_OPTIONS["num_thread"] = OLLAMA_NUM_THREAD
+
+
+def _warm_up_request() -> Tuple[str, Dict[str, str]]:
+    """Cheap GET used to open a connection to the configured provider"""
+    if LLM_PROVIDER == "deepseek":
+        return f"{_DEEPSEEK_BASE_URL}/models", {"Authorization": f"Bearer {DEEPSEEK_API_KEY}"}
+    elif LLM_PROVIDER == "openai":
+        return f"{_OPENAI_BASE_URL}/models", {"Authorization": f"Bearer {OPENAI_API_KEY}"}
+    return f"{OLLAMA_URL}/api/version", {}
+
+
+async def warm_up_llm_client() -> None:
+    """
+    Open the provider connections before the first document arrives (call from the app startup hook)
+    Completes the TCP/TLS handshake and HTTP/2 SETTINGS exchange on both shared clients
+    """
+    if not await check_llm_available_async():
+        return
+    url, headers = _warm_up_request()
+    try:
+        await asyncio.gather(
+            _get_async_client().get(url, headers=headers, timeout=5.0),
+            asyncio.to_thread(_get_client().get, url, headers=headers, timeout=5.0)
+        )
+        if LLM_PROVIDER == "ollama":
+            await _warn_if_unquantized()
+            await _prime_ollama_prefix()
+    except Exception as e:
+        logger.warning("LLM connection warm-up failed: %s", e)
+
+
+async def _prime_ollama_prefix() -> None:
+    """Load OLLAMA_MODEL and prefill the extraction rules so the first document reuses their KV cache"""
+    url, headers, payload = _build_llm_request(_EXTRACT_PROMPT_HEAD, 1, _EXTRACT_AND_FILENAME_PROMPT_PREFIX)
+    await _get_async_client().post(url, headers=headers, content=_json_dumps(payload), timeout=_LLM_TIMEOUT)
+
+
+async def _warn_if_unquantized() -> None:
+    """Log a warning if OLLAMA_MODEL is a full-precision (F16/F32) build"""
+    response = await _get_async_client().post(f"{OLLAMA_URL}/api/show", content=_json_dumps({"model": OLLAMA_MODEL}), timeout=5.0)
+    if response.status_code != 200:
+        return
+    quantization = (_json_loads(response.content).get("details") or {}).get("quantization_level", "")
+    if quantization.upper().startswith(("F16", "F32", "BF16")):
+        logger.warning("Ollama model %s is %s; a 4-bit build (e.g. qwen2.5:7b-instruct-q4_K_M) decodes several times faster", OLLAMA_MODEL, quantization)
+
+
+# Hosted providers only need a configured API key, which cannot change after import
+_HOSTED_LLM_READY = bool({"deepseek": DEEPSEEK_API_KEY, "openai": OPENAI_API_KEY}.get(LLM_PROVIDER, "").strip())
+
 
 def check_llm_available() -> bool:
     """Check if LLM is available (Ollama, DeepSeek, or OpenAI)"""
     if not USE_LLM:
         return False
     
-    if LLM_PROVIDER == "deepseek":
-        # Check if DeepSeek API key is configured
-        return bool(DEEPSEEK_API_KEY and DEEPSEEK_API_KEY.strip())
-    elif LLM_PROVIDER == "openai":
-        # Check if OpenAI API key is configured
-        return bool(OPENAI_API_KEY and OPENAI_API_KEY.strip())
+    if LLM_PROVIDER in ("deepseek", "openai"):
+        return _HOSTED_LLM_READY
     else:
-        # Check if Ollama is available
+        # Check if Ollama is available (probe result is reused for LLM_AVAILABILITY_TTL seconds)
+        if time.monotonic() - _AVAIL_CACHE["ts"] < LLM_AVAILABILITY_TTL:
+            return _AVAIL_CACHE["ok"]
+        with _AVAIL_LOCK:
+            # Another thread may have probed while this one waited for the lock
+            if time.monotonic() - _AVAIL_CACHE["ts"] < LLM_AVAILABILITY_TTL:
+                return _AVAIL_CACHE["ok"]
+            try:
+                # /api/version is a tiny response, unlike /api/tags which lists every model
+                response = _get_client().get(f"{OLLAMA_URL}/api/version", timeout=1.0)
+                ok = response.status_code == 200
+            except:
+                ok = False
+            # Result first, then timestamp: lock-free readers never see a fresh ts with a stale result
+            _AVAIL_CACHE["ok"] = ok
+            _AVAIL_CACHE["ts"] = time.monotonic()
+            return ok
+
+
+async def check_llm_available_async() -> bool:
+    """Async variant of check_llm_available; probes Ollama with the async client instead of blocking the loop"""
+    if not USE_LLM:
+        return False
+    
+    if LLM_PROVIDER in ("deepseek", "openai"):
+        return _HOSTED_LLM_READY
+    if time.monotonic() - _AVAIL_CACHE["ts"] < LLM_AVAILABILITY_TTL:
+        return _AVAIL_CACHE["ok"]
+    async with _get_avail_lock():
+        # Another task may have probed while this one waited for the lock
+        if time.monotonic() - _AVAIL_CACHE["ts"] < LLM_AVAILABILITY_TTL:
+            return _AVAIL_CACHE["ok"]
         try:
-            response = httpx.get(f"{OLLAMA_URL}/api/tags", timeout=2.0)
-            return response.status_code == 200
-        except:
-            return False
+            response = await _get_async_client().get(f"{OLLAMA_URL}/api/version", timeout=1.0)
+            ok = response.status_code == 200
+        except Exception:
+            ok = False
+        _AVAIL_CACHE["ok"] = ok
+        _AVAIL_CACHE["ts"] = time.monotonic()
+        return ok
+
+
+def _invalidate_availability() -> None:
+    """Forget the cached Ollama probe so the next check_llm_available() re-probes"""
+    _AVAIL_CACHE["ts"] = float("-inf")
 
 
 def check_ollama_available() -> bool:
@@ -52,10 +343,72 @@ def check_ollama_available() -> bool:
     return check_llm_available() if LLM_PROVIDER == "ollama" else False
 
 
-def _call_llm_api(prompt: str, max_tokens: int = 200) -> Optional[str]:
+def _active_model(model: Optional[str] = None) -> str:
+    """Model name for the configured provider (or the explicit override)"""
+    if model:
+        return model
+    if LLM_PROVIDER == "deepseek":
+        return DEEPSEEK_MODEL
+    elif LLM_PROVIDER == "openai":
+        return OPENAI_MODEL
+    return OLLAMA_MODEL
+
+
+def _is_fixed_temperature_model(model: Optional[str] = None) -> bool:
+    """GPT-5 Nano only supports temperature=1 (default), so its output is not deterministic"""
+    model_name = _active_model(model).lower()
+    return LLM_PROVIDER == "openai" and ("gpt-5" in model_name or "nano" in model_name)
+
+
+# Part of every response cache key. The prompt text is keyed already; bump this when
+# something else that shapes the reply changes (schemas, sampling options, request format)
+_PROMPT_VERSION = "v2"
+
+
+def _response_cache_key(prompt: str, max_tokens: int, system: Optional[str] = None, json_mode: bool = False, model: Optional[str] = None) -> Optional[str]:
     """
-    Internal function to call LLM API (Ollama, DeepSeek, or OpenAI)
-    Returns the response text or None if failed
+    Cache key for an LLM request, or None if the response should not be cached
+    Only low-temperature (effectively deterministic) calls are cached
+    """
+    if _is_fixed_temperature_model(model):
+        return None
+    return make_cache_key(LLM_PROVIDER, _active_model(model), max_tokens, prompt, system or "", json_mode, _PROMPT_VERSION)
+
+
+def _is_cacheable(response_text: Optional[str], json_mode: bool) -> bool:
+    """Only keep usable responses: JSON-mode replies must contain a JSON object"""
+    if not response_text:
+        return False
+    return not json_mode or _extract_first_json(response_text) is not None
+
+
+# Shared, never-mutated payload fragments
+_JSON_RESPONSE_FORMAT = {"type": "json_object"}
+
+
+@lru_cache(maxsize=8)
+def _system_message(system: str) -> Dict[str, str]:
+    """System message for a static prefix, built once and reused by every request"""
+    return {"role": "system", "content": system}
+
+
+def _chat_messages(prompt: str, system: Optional[str]) -> List[Dict[str, str]]:
+    """Chat messages with the static system prefix first and the per-call prompt last"""
+    if system:
+        return [_system_message(system), {"role": "user", "content": prompt}]
+    return [{"role": "user", "content": prompt}]
+
+
+@lru_cache(maxsize=8)
+def _prompt_cache_key(system: str) -> str:
+    """Stable OpenAI prompt_cache_key for a system prefix"""
+    return hashlib.sha1(system.encode("utf-8")).hexdigest()[:16]
+
+
+def _build_llm_request(prompt: str, max_tokens: int, system: Optional[str] = None, json_mode: bool = False, model: Optional[str] = None) -> Tuple[str, Dict[str, str], Dict[str, Any]]:
+    """
+    Build the provider-specific request for an LLM call
+    Returns (url, headers, json_payload); headers always include the JSON Content-Type
     """
     if LLM_PROVIDER == "deepseek":
         # DeepSeek API call (OpenAI-compatible)
@@ -63,419 +416,1186 @@ def _call_llm_api(prompt: str, max_tokens: int = 200) -> Optional[str]:
         # Adjust max_tokens based on provider: DeepSeek needs less, GPT-5 Nano needs more
         effective_max_tokens = max_tokens if max_tokens <= 1000 else 1000
         
-        # Ensure URL has protocol prefix
-        api_url = DEEPSEEK_API_URL
-        if not api_url:
-            api_url = "https://api.deepseek.com/v1/chat/completions"
-        elif not api_url.startswith(("http://", "https://")):
-            # If URL doesn't have protocol, add https://
-            api_url = f"https://{api_url}"
-        
-        print(f"DeepSeek API URL: {api_url}")
-        print(f"DeepSeek API Key set: {bool(DEEPSEEK_API_KEY and DEEPSEEK_API_KEY.strip())}")
-        
-        try:
-            response = httpx.post(
-                api_url,
-                headers={
-                    "Authorization": f"Bearer {DEEPSEEK_API_KEY}",
-                    "Content-Type": "application/json",
-                    "X-Data-Usage-Opt-Out": "true"  # Opt out of data retention and training
-                },
-                json={
-                    "model": DEEPSEEK_MODEL,
-                    "messages": [
-                        {"role": "user", "content": prompt}
-                    ],
-                    "temperature": 0.1,
-                    "max_tokens": effective_max_tokens
-                },
-                timeout=30.0
-            )
-            
-            if response.status_code == 200:
-                result = response.json()
-                return result.get("choices", [{}])[0].get("message", {}).get("content", "").strip()
-            else:
-                print(f"DeepSeek API error: {response.status_code} - {response.text}")
-                return None
-        except Exception as e:
-            print(f"DeepSeek API call error: {e}")
-            return None
+        payload = {
+            "model": model or DEEPSEEK_MODEL,
+            "messages": _chat_messages(prompt, system),
+            "temperature": 0.1,
+            "max_tokens": effective_max_tokens
+        }
+        if json_mode:
+            payload["response_format"] = _JSON_RESPONSE_FORMAT
+        return _DEEPSEEK_CHAT_URL, _DEEPSEEK_HEADERS, payload
     elif LLM_PROVIDER == "openai":
         # OpenAI/GPT-5 Nano API call
-        try:
-            # GPT-5 Nano uses max_completion_tokens instead of max_tokens
-            # GPT-5 Nano only supports temperature=1 (default), not 0.1
-            api_payload = {
-                "model": OPENAI_MODEL,
-                "messages": [
-                    {"role": "user", "content": prompt}
-                ]
-            }
-            # Check if model is GPT-5 Nano (uses max_completion_tokens and only supports temperature=1)
-            if "gpt-5" in OPENAI_MODEL.lower() or "nano" in OPENAI_MODEL.lower():
-                api_payload["max_completion_tokens"] = max_tokens
-                # GPT-5 Nano only supports temperature=1 (default), so don't set it
-            else:
-                api_payload["max_tokens"] = max_tokens
-                api_payload["temperature"] = 0.1  # Other OpenAI models can use lower temperature
-            
-            response = httpx.post(
-                OPENAI_API_URL,
-                headers={
-                    "Authorization": f"Bearer {OPENAI_API_KEY}",
-                    "Content-Type": "application/json"
-                },
-                json=api_payload,
-                timeout=30.0
-            )
-            
-            if response.status_code == 200:
-                result = response.json()
-                choices = result.get("choices", [])
-                if choices:
-                    message = choices[0].get("message", {})
-                    content = message.get("content", "").strip()
-                    if not content:
-                        print(f"OpenAI API response is empty! Full result: {result}")
-                    return content
-                else:
-                    print(f"OpenAI API no choices in response: {result}")
-                    return None
+        # GPT-5 Nano uses max_completion_tokens instead of max_tokens
+        # GPT-5 Nano only supports temperature=1 (default), not 0.1
+        payload = {
+            "model": model or OPENAI_MODEL,
+            "messages": _chat_messages(prompt, system)
+        }
+        if system:
+            # Route requests sharing the same prefix to the same prompt cache
+            payload["prompt_cache_key"] = _prompt_cache_key(system)
+        # Check if model is GPT-5 Nano (uses max_completion_tokens and only supports temperature=1)
+        if _is_fixed_temperature_model(model):
+            payload["max_completion_tokens"] = max_tokens
+            # GPT-5 Nano only supports temperature=1 (default), so don't set it
+        else:
+            payload["max_tokens"] = max_tokens
+            payload["temperature"] = 0.1  # Other OpenAI models can use lower temperature
+        if json_mode:
+            payload["response_format"] = _JSON_RESPONSE_FORMAT
+        return OPENAI_API_URL, _OPENAI_HEADERS, payload
+    else:
+        # Ollama API call: /api/chat with the static rules as the first (system) message,
+        # so the server reuses the KV cache for the shared prefix
+        payload = {
+            "model": model or OLLAMA_MODEL,
+            "messages": _chat_messages(prompt, system),
+            "stream": False,
+            "keep_alive": OLLAMA_KEEP_ALIVE,
+            "options": {**_OLLAMA_OPTIONS, "num_predict": max_tokens}
+        }
+        if json_mode:
+            # Schema mode decodes only the expected keys; plain JSON mode for other prompts
+            payload["format"] = _OLLAMA_JSON_SCHEMAS.get(system or "", "json") if OLLAMA_JSON_SCHEMA else "json"
+        return _OLLAMA_CHAT_URL, _OLLAMA_HEADERS, payload
+
+
+def _parse_llm_response(response: httpx.Response) -> Optional[str]:
+    """
+    Extract the generated text from a provider response
+    Returns the response text or None if the call failed
+    """
+    if LLM_PROVIDER == "deepseek":
+        if response.status_code == 200:
+            result = _json_loads(response.content)
+            return result.get("choices", [{}])[0].get("message", {}).get("content", "").strip()
+        logger.warning("DeepSeek API error: %s - %s", response.status_code, response.text)
+        return None
+    elif LLM_PROVIDER == "openai":
+        if response.status_code == 200:
+            result = _json_loads(response.content)
+            choices = result.get("choices", [])
+            if choices:
+                message = choices[0].get("message", {})
+                content = message.get("content", "").strip()
+                if not content:
+                    logger.warning("OpenAI API response is empty")
+                    if logger.isEnabledFor(logging.DEBUG):
+                        logger.debug("OpenAI full response: %s", result)
+                return content
             else:
-                print(f"OpenAI API error: {response.status_code} - {response.text}")
+                logger.warning("OpenAI API no choices in response")
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("OpenAI full response: %s", result)
                 return None
-        except Exception as e:
-            print(f"OpenAI API call error: {e}")
-            return None
+        logger.warning("OpenAI API error: %s - %s", response.status_code, response.text)
+        return None
     else:
-        # Ollama API call
+        if response.status_code == 200:
+            result = _json_loads(response.content)
+            return (result.get("message") or {}).get("content", "").strip()
+        logger.warning("Ollama API error: %s", response.status_code)
+        if response.status_code >= 500:
+            _invalidate_availability()
+        return None
+
+
+def _provider_label() -> str:
+    """Human-readable provider name for log messages"""
+    return {"deepseek": "DeepSeek", "openai": "OpenAI"}.get(LLM_PROVIDER, "Ollama")
+
+
+def _retry_delay(attempt: int, response: Optional[httpx.Response] = None) -> float:
+    """Seconds to wait before the next attempt: Retry-After if the provider sent one, else exponential backoff, plus jitter"""
+    delay = 2.0 ** attempt
+    retry_after = response.headers.get("Retry-After") if response is not None else None
+    if retry_after:
         try:
-            response = httpx.post(
-                f"{OLLAMA_URL}/api/generate",
-                json={
-                    "model": OLLAMA_MODEL,
-                    "prompt": prompt,
-                    "stream": False,
-                    "options": {
-                        "temperature": 0.1,
-                        "num_predict": max_tokens
-                    }
-                },
-                timeout=30.0
-            )
-            
-            if response.status_code == 200:
-                result = response.json()
-                return result.get("response", "").strip()
+            delay = float(retry_after)
+        except ValueError:
+            pass  # HTTP-date form; keep the exponential delay
+    return min(delay, LLM_RETRY_MAX_DELAY) + random.uniform(0, 0.5)
+
+
+def _post_with_retry(url: str, headers: Dict[str, str], body: bytes) -> httpx.Response:
+    """POST to the provider, retrying 429/5xx responses and connection failures (not read timeouts) with backoff"""
+    for attempt in range(LLM_MAX_RETRIES + 1):
+        try:
+            response = _get_client().post(url, headers=headers, content=body, timeout=_LLM_TIMEOUT)
+        except _RETRY_TRANSPORT_ERRORS as e:
+            if attempt == LLM_MAX_RETRIES:
+                raise
+            logger.warning("%s API connection error (attempt %d): %s", _provider_label(), attempt + 1, e)
+            time.sleep(_retry_delay(attempt))
+            continue
+        if response.status_code not in _RETRY_STATUS_CODES or attempt == LLM_MAX_RETRIES:
+            return response
+        logger.warning("%s API returned %s (attempt %d), retrying", _provider_label(), response.status_code, attempt + 1)
+        time.sleep(_retry_delay(attempt, response))
+    raise AssertionError("unreachable")
+
+
+async def _post_with_retry_async(url: str, headers: Dict[str, str], body: bytes) -> httpx.Response:
+    """Async variant of _post_with_retry; the concurrency slot is released while backing off"""
+    for attempt in range(LLM_MAX_RETRIES + 1):
+        try:
+            async with _get_llm_semaphore():
+                response = await _get_async_client().post(url, headers=headers, content=body, timeout=_LLM_TIMEOUT)
+        except _RETRY_TRANSPORT_ERRORS as e:
+            if attempt == LLM_MAX_RETRIES:
+                raise
+            logger.warning("%s API connection error (attempt %d): %s", _provider_label(), attempt + 1, e)
+            await asyncio.sleep(_retry_delay(attempt))
+            continue
+        if response.status_code not in _RETRY_STATUS_CODES or attempt == LLM_MAX_RETRIES:
+            return response
+        logger.warning("%s API returned %s (attempt %d), retrying", _provider_label(), response.status_code, attempt + 1)
+        await asyncio.sleep(_retry_delay(attempt, response))
+    raise AssertionError("unreachable")
+
+
+class _JsonStreamCollector:
+    """
+    Accumulates streamed LLM output and reports when the first JSON object is complete
+    Braces inside JSON strings are ignored
+    """
+
+    def __init__(self):
+        self.parts: List[str] = []
+        self._depth = 0
+        self._started = False
+        self._in_string = False
+        self._escaped = False
+
+    @property
+    def text(self) -> str:
+        return "".join(self.parts).strip()
+
+    def feed_line(self, line: str) -> bool:
+        """Add one streamed line (SSE for OpenAI/DeepSeek, NDJSON for Ollama); True once reading can stop"""
+        if not line:
+            return False
+        if LLM_PROVIDER in ("deepseek", "openai"):
+            if not line.startswith("data:"):
+                return False
+            data = line[5:].strip()
+            if data == "[DONE]":
+                return True
+            choices = _json_loads(data).get("choices") or [{}]
+            delta = (choices[0].get("delta") or {}).get("content") or ""
+            finished = False
+        else:
+            chunk = _json_loads(line)
+            delta = (chunk.get("message") or {}).get("content", "")
+            finished = bool(chunk.get("done"))
+        if delta:
+            self.parts.append(delta)
+            if self._object_closed(delta):
+                return True
+        return finished
+
+    def _object_closed(self, chunk: str) -> bool:
+        for char in chunk:
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"' and self._started:
+                self._in_string = True
+            elif char == "{":
+                self._depth += 1
+                self._started = True
+            elif char == "}" and self._started:
+                self._depth -= 1
+                if self._depth == 0:
+                    return True
+        return False
+
+
+def _stream_llm_text(url: str, headers: Dict[str, str], body: bytes) -> Optional[str]:
+    """
+    POST a streaming request and return the text as soon as the first JSON object is complete
+    Retries 429/5xx responses and connection errors like _post_with_retry
+    """
+    for attempt in range(LLM_MAX_RETRIES + 1):
+        try:
+            with _get_client().stream("POST", url, headers=headers, content=body, timeout=_LLM_TIMEOUT) as response:
+                if response.status_code in _RETRY_STATUS_CODES and attempt < LLM_MAX_RETRIES:
+                    delay = _retry_delay(attempt, response)
+                elif response.status_code != 200:
+                    response.read()
+                    return _parse_llm_response(response)
+                else:
+                    collector = _JsonStreamCollector()
+                    for line in response.iter_lines():
+                        if collector.feed_line(line):
+                            break
+                    # Leaving the block closes the stream, which stops the generation
+                    return collector.text
+        except _RETRY_TRANSPORT_ERRORS as e:
+            if attempt == LLM_MAX_RETRIES:
+                raise
+            logger.warning("%s API connection error (attempt %d): %s", _provider_label(), attempt + 1, e)
+            time.sleep(_retry_delay(attempt))
+            continue
+        logger.warning("%s API returned %s (attempt %d), retrying", _provider_label(), response.status_code, attempt + 1)
+        time.sleep(delay)
+    return None
+
+
+async def _stream_llm_text_async(url: str, headers: Dict[str, str], body: bytes) -> Optional[str]:
+    """Async variant of _stream_llm_text; holds a concurrency slot while the stream is open"""
+    for attempt in range(LLM_MAX_RETRIES + 1):
+        try:
+            async with _get_llm_semaphore():
+                async with _get_async_client().stream("POST", url, headers=headers, content=body, timeout=_LLM_TIMEOUT) as response:
+                    if response.status_code in _RETRY_STATUS_CODES and attempt < LLM_MAX_RETRIES:
+                        delay = _retry_delay(attempt, response)
+                    elif response.status_code != 200:
+                        await response.aread()
+                        return _parse_llm_response(response)
+                    else:
+                        collector = _JsonStreamCollector()
+                        async for line in response.aiter_lines():
+                            if collector.feed_line(line):
+                                break
+                        return collector.text
+        except _RETRY_TRANSPORT_ERRORS as e:
+            if attempt == LLM_MAX_RETRIES:
+                raise
+            logger.warning("%s API connection error (attempt %d): %s", _provider_label(), attempt + 1, e)
+            await asyncio.sleep(_retry_delay(attempt))
+            continue
+        logger.warning("%s API returned %s (attempt %d), retrying", _provider_label(), response.status_code, attempt + 1)
+        await asyncio.sleep(delay)
+    return None
+
+
+def _breaker_open() -> bool:
+    """True while the circuit breaker is skipping LLM calls"""
+    return time.monotonic() < _BREAKER["open_until"]
+
+
+def _record_llm_outcome(ok: bool) -> None:
+    """
+    Reset the breaker on success; open it after LLM_BREAKER_THRESHOLD failures in a row
+    The count is kept while open, so one failed trial call after the cooldown reopens it
+    """
+    if ok:
+        _BREAKER["fails"] = 0
+        return
+    _BREAKER["fails"] += 1
+    if _BREAKER["fails"] >= LLM_BREAKER_THRESHOLD:
+        _BREAKER["open_until"] = time.monotonic() + LLM_BREAKER_COOLDOWN
+        logger.warning("%s failed %d times in a row, skipping LLM calls for %.0fs", _provider_label(), _BREAKER["fails"], LLM_BREAKER_COOLDOWN)
+
+
+def _call_llm_api(prompt: str, max_tokens: int = 200, system: Optional[str] = None, json_mode: bool = False, model: Optional[str] = None) -> Optional[str]:
+    """
+    Internal function to call LLM API (Ollama, DeepSeek, or OpenAI)
+    An optional system prompt is sent ahead of the prompt as a cacheable prefix
+    json_mode asks the provider to constrain the output to a JSON object
+    model overrides the provider's configured model for this call
+    Returns the response text or None if failed
+    """
+    cache_key = _response_cache_key(prompt, max_tokens, system, json_mode, model)
+    if cache_key:
+        cached = get_llm_cache().get(cache_key)
+        if cached is not None:
+            return cached
+    if _breaker_open():
+        return None
+    
+    url, headers, payload = _build_llm_request(prompt, max_tokens, system, json_mode, model)
+    try:
+        if LLM_STREAM and json_mode:
+            response_text = _stream_llm_text(url, headers, _json_dumps({**payload, "stream": True}))
+        else:
+            response = _post_with_retry(url, headers, _json_dumps(payload))
+            response_text = _parse_llm_response(response)
+    except Exception as e:
+        logger.warning("%s API call error: %s", _provider_label(), e)
+        if isinstance(e, httpx.TransportError):
+            _invalidate_availability()
+        _record_llm_outcome(False)
+        return None
+    
+    _record_llm_outcome(response_text is not None)
+    if cache_key and _is_cacheable(response_text, json_mode):
+        get_llm_cache().set(cache_key, response_text)
+    return response_text
+
+
+async def _call_llm_api_async(prompt: str, max_tokens: int = 200, system: Optional[str] = None, json_mode: bool = False, model: Optional[str] = None) -> Optional[str]:
+    """
+    Async variant of _call_llm_api
+    Concurrency is bounded by LLM_MAX_CONCURRENCY to respect provider rate limits
+    """
+    cache_key = _response_cache_key(prompt, max_tokens, system, json_mode, model)
+    if cache_key:
+        cached = get_llm_cache().get(cache_key)
+        if cached is not None:
+            return cached
+    if _breaker_open():
+        return None
+    
+    # Identical requests already in flight share one round-trip
+    inflight_key = hashlib.blake2b(
+        f"{model or ''}\0{max_tokens}\0{json_mode}\0{system or ''}\0{prompt}".encode("utf-8"), digest_size=16
+    ).hexdigest()
+    pending = _INFLIGHT.get(inflight_key)
+    if pending is not None:
+        return await asyncio.shield(pending)
+    
+    future: "asyncio.Future[Optional[str]]" = asyncio.get_running_loop().create_future()
+    _INFLIGHT[inflight_key] = future
+    response_text = None
+    try:
+        url, headers, payload = _build_llm_request(prompt, max_tokens, system, json_mode, model)
+        try:
+            if LLM_STREAM and json_mode:
+                response_text = await _stream_llm_text_async(url, headers, _json_dumps({**payload, "stream": True}))
             else:
-                print(f"Ollama API error: {response.status_code}")
-                return None
+                response = await _post_with_retry_async(url, headers, _json_dumps(payload))
+                response_text = _parse_llm_response(response)
         except Exception as e:
-            print(f"Ollama API call error: {e}")
+            logger.warning("%s API call error: %s", _provider_label(), e)
+            if isinstance(e, httpx.TransportError):
+                _invalidate_availability()
+            _record_llm_outcome(False)
             return None
+        
+        _record_llm_outcome(response_text is not None)
+        if cache_key and _is_cacheable(response_text, json_mode):
+            get_llm_cache().set(cache_key, response_text)
+        return response_text
+    finally:
+        del _INFLIGHT[inflight_key]
+        if not future.done():
+            future.set_result(response_text)
+
+
+# Deterministic fast path (extract_fast). When the document type, issuer and date
+# can all be read with regexes, the LLM call is skipped entirely; anything
+# ambiguous falls through to the LLM.
+# Classification keywords from the prompt rulebook, grouped by label. They are
+# compiled into a single alternation so one pass over the text finds every hit.
+_DOC_KEYWORDS: Dict[str, List[str]] = {
+    "BuyPhrase": ["has bought", "bought for you", "we have bought"],
+    "SellPhrase": ["has sold", "sold for you", "we have sold", "confirm your sale", "buy/sell: sell"],
+    "BuyTitle": ["buy confirmation"],
+    "SellTitle": ["sell confirmation"],
+    "Confirmation": ["confirmation", "contract note"],
+    "DividendStatement": ["dividend statement", "dividend advice", "dividend payment"],
+    "DistributionStatement": ["distribution statement", "distribution advice", "distribution payment", "net distribution"],
+    "CapitalCallStatement": ["capital call", "notice of capital call"],
+    "HoldingStatement": ["holding statement", "shareholding statement", "portfolio summary", "share summary"],
+    "BankStatement": ["bank statement"],
+    "TaxStatement": ["tax statement", "tax summary", "amit", "amma", "nav & taxation statement"],
+    "NetAssetSummaryStatement": ["net asset summary", "nav summary"],
+    "FinancialStatement": ["financial statements", "directors' report", "directors report"],
+    # Supporting hints: these also appear on most other statement types, so they never
+    # classify on their own. Holder ids plus "holding(s)" without any statement title
+    # make a HoldingStatement (_classify_statement); the rest only widen _CONTEXT_TRIGGERS
+    "HolderHint": ["chess", "hin", "srn", "holder identification number", "securityholder reference number"],
+    "HoldingHint": ["holding", "holdings"],
+    "BankHint": ["bsb"],
+    "YearEndHint": ["annual report", "for the year ended"],
+}
+
+
+def _keyword_key(keyword: str) -> str:
+    """Normalise a keyword or match for lookup (lower case, no whitespace)"""
+    return "".join(keyword.lower().split())
+
+
+_KEYWORD_LABELS = {_keyword_key(kw): label for label, kws in _DOC_KEYWORDS.items() for kw in kws}
+# ASCII-only case folding: Unicode re.I also matches "İ"/"ı"/"ſ" as i/s, and those
+# matches would not lower() back to a _KEYWORD_LABELS key
+_KEYWORD_RE = re.compile(
+    r"\b(?:"
+    + "|".join(
+        r"\s*".join(re.escape(word) for word in kw.split())
+        for kw in sorted((kw for kws in _DOC_KEYWORDS.values() for kw in kws), key=len, reverse=True)
+    )
+    + r")\b",
+    re.I | re.ASCII
+)
+# Upper-case BUY/SELL box on a confirmation (case-sensitive, unlike the keywords)
+_TRADE_SIDE_RE = re.compile(r"\b(BUY|SELL)\b")
+
+
+def _scan_keywords(text: str) -> Counter:
+    """Count classification keyword hits per label in a single pass over the text"""
+    return Counter(_KEYWORD_LABELS[_keyword_key(m.group(0))] for m in _KEYWORD_RE.finditer(text))
+
+# Security name fields, in priority order
+_TRADE_ISSUER_RES = [
+    re.compile(r"\bCOMPANY:[ \t]*([^\n]+)"),
+    re.compile(r"\bStock Description:?[ \t]*([^\n]+)", re.I),
+    re.compile(r"\bSecurity Description:?[ \t]*([^\n]+?)(?:[ \t]+Price\b|$)", re.I | re.M),
+]
+_ISSUER_DESCRIPTOR_RE = re.compile(r"\s+(?:ORDINARY FULLY PAID|FULLY PAID ORDINARY|FPO)\b.*$", re.I)
+
+# Names that are never the issuer: registries, trustees, investors and document labels.
+# Checked in code after every extraction instead of being listed in the prompt.
+# Matched as whole words; spaces also match glued OCR runs ("BuyConfirmation").
+# Fund managers share names with their service arms ("Morgan Stanley ... Fund" is a
+# fund), so service providers are listed by their full service names.
+_ISSUER_BLACKLIST = [
+    "AMAL Causeway Trustees", "Computershare Investor Services", "Link Market Services",
+    "OIF Registry Services", "Automic Registry Services", "Fidante Partners Services",
+    "Morgan Stanley Fund Services",
+    "GENLIM PTY LTD", "Simon Cunnington",
+    "BUY CONFIRMATION", "SELL CONFIRMATION", "TAX INVOICE", "Retain for taxation purposes",
+]
+# Brokers: only wrong as the issuer of a BuyContract/SellContract (the security is wanted)
+_ISSUER_BROKERS = ["CommSec", "JBWere", "Ord Minnett", "Morgan Stanley", "Equity & Super", "EquitySuper"]
+
+
+def _whole_name_re(names: List[str]) -> "re.Pattern[str]":
+    """Case-insensitive whole-word alternation of names, longest first"""
+    return re.compile(
+        r"\b(?:"
+        + "|".join(r"\s*".join(re.escape(word) for word in name.split()) for name in sorted(names, key=len, reverse=True))
+        + r")(?!\w)",
+        re.I
+    )
+
+
+_ISSUER_BLACKLIST_RE = _whole_name_re(_ISSUER_BLACKLIST)
+_ISSUER_BROKER_RE = _whole_name_re(_ISSUER_BROKERS)
+# Labels, column headers and bare provider names that are only wrong as the whole value
+_ISSUER_LABELS = frozenset(
+    _keyword_key(label) for label in (
+        "Quantity", "Currency", "Price", "Consideration", "Brokerage", "Account No", "Confirmation No",
+        "Trade Date", "Settlement Date", "Market", "Order Status", "HIN", "Adviser Name",
+        "Distribution Statement", "Distribution Advice",
+        "Computershare", "Automic", "Fidante",
+    )
+)
+
+
+def _is_blacklisted_issuer(issuer: str, doc_type: Optional[str] = None) -> bool:
+    """True if issuer is a registry/investor name (or a broker on a trade), a document label or a disclaimer"""
+    return (
+        len(issuer) > 100
+        or _keyword_key(issuer) in _ISSUER_LABELS
+        or _ISSUER_BLACKLIST_RE.search(issuer) is not None
+        or (doc_type in ("BuyContract", "SellContract") and _ISSUER_BROKER_RE.search(issuer) is not None)
+    )
+
+# Trade dates, in priority order (Settlement Date is never used)
+_DATE_VALUE = r"(\d{4}-\d{2}-\d{2}|\d{1,2}[/-]\d{1,2}[/-]\d{4}|\d{1,2}[ \t-]+[A-Za-z]{3,9}[ \t-]+\d{4})"
+_TRADE_DATE_RES = [
+    re.compile(r"\bTrade Date:?[ \t]*" + _DATE_VALUE, re.I),
+    re.compile(r"\bConfirmation Date:?[ \t]*" + _DATE_VALUE, re.I),
+    re.compile(r"\bTransaction Date:?[ \t]*" + _DATE_VALUE, re.I),
+]
+
+# Statement types the fast path may assign; one must clearly dominate the keyword
+# counts (or the labels must form one of the combinations below)
+_STATEMENT_LABELS = (
+    "DividendStatement", "DistributionStatement", "CapitalCallStatement", "HoldingStatement",
+    "BankStatement", "TaxStatement", "NetAssetSummaryStatement", "FinancialStatement",
+)
+_STATEMENT_COMBINATIONS = {
+    frozenset(("CapitalCallStatement", "DistributionStatement")): "CallAndDistributionStatement",
+    frozenset(("TaxStatement", "NetAssetSummaryStatement")): "TaxStatement",
+}
+
+# Issuer fields per statement type, in priority order
+_FUND_FIELD_RE = re.compile(r"\bFund(?: Name)?:[ \t]*([^\n]+)", re.I)
+_COMPANY_FIELD_RE = re.compile(r"\b(?:Company|Issuer)(?: Name)?:[ \t]*([^\n]+)", re.I)
+_STATEMENT_ISSUER_RES: Dict[str, List["re.Pattern[str]"]] = {
+    "DistributionStatement": [
+        _FUND_FIELD_RE,
+        re.compile(r"^[ \t]*(.+?)[ \t]+Distribution (?:Statement|Advice)\b", re.I | re.M),
+    ],
+    "HoldingStatement": [
+        re.compile(r"^[ \t]*(.+?)[ \t]+Share Summary\b", re.I | re.M),
+        _FUND_FIELD_RE,
+    ],
+    "NetAssetSummaryStatement": [
+        _FUND_FIELD_RE,
+        re.compile(r"^[ \t]*(.+?)[ \t]+(?:NAV|Net Asset) (?:Statement|Summary)\b", re.I | re.M),
+    ],
+    "FinancialStatement": [
+        re.compile(
+            r"^[ \t]*(.+?)[ \t]+(?:DIRECTORS'? REPORT|(?:ANNUAL |AUDITED |CONSOLIDATED )?FINANCIAL STATEMENTS)\b",
+            re.I | re.M
+        ),
+    ],
+}
+_DEFAULT_ISSUER_RES = [_FUND_FIELD_RE, _COMPANY_FIELD_RE]
+
+
+def _labelled_date_res(*labels: str) -> List["re.Pattern[str]"]:
+    """Compile '<label>: <date>' patterns in priority order"""
+    return [re.compile(r"\b" + label + r":?[ \t]*" + _DATE_VALUE, re.I) for label in labels]
+
+
+# Statement dates per type, in priority order
+_STATEMENT_DATE_RES: Dict[str, List["re.Pattern[str]"]] = {
+    "DividendStatement": _labelled_date_res("Payment Date", "Record Date", "Statement Date"),
+    "DistributionStatement": _labelled_date_res("Payment Date", "Record Date", "Distribution Date"),
+    "CallAndDistributionStatement": _labelled_date_res("Payment Date", "Due Date", "Statement Date"),
+    "CapitalCallStatement": _labelled_date_res("Due Date", "Call Date", "Statement Date"),
+    "FinancialStatement": _labelled_date_res("For the year ended", "Year End(?:ed)?(?: Date)?", "Statement Date"),
+}
+_DEFAULT_DATE_RES = _labelled_date_res("Statement Date", "As at", "Date")
+
+_DOC_TYPE_TAGS = {
+    "DividendStatement": "Dividend Statement",
+    "DistributionStatement": "Distribution Statement",
+    "CapitalCallStatement": "Capital Call",
+    "CallAndDistributionStatement": "Distribution and Capital Call",
+    "PeriodicStatement": "Periodic Statement",
+    "BankStatement": "Bank Statement",
+    "BuyContract": "Buy Contract",
+    "SellContract": "Sell Contract",
+    "HoldingStatement": "Holding Statement",
+    "TaxStatement": "Tax Statement",
+    "NetAssetSummaryStatement": "Net Asset Summary",
+    "FinancialStatement": "Financial Statement"
+}
+_ISSUER_SUFFIX_RE = re.compile(r",?\s+(?:Pty\.? Ltd\.?|Limited|Ltd\.?)$", re.I)
+
+
+def doc_type_tag(doc_type: str) -> str:
+    """Readable filename tag for a doc type; unknown types have their CamelCase split"""
+    return _DOC_TYPE_TAGS.get(doc_type) or re.sub(r"(?<=[a-z])(?=[A-Z])", " ", doc_type.replace("_", " ")).title()
+
+
+def _parse_au_date(value: str) -> Optional[str]:
+    """Parse an Australian (day-first) date such as 11/07/2025 or 09 May 2025 (or ISO 2025-07-11) into YYYY-MM-DD"""
+    value = " ".join(value.replace("/", " ").replace("-", " ").split())
+    for fmt in ("%d %m %Y", "%d %b %Y", "%d %B %Y", "%Y %m %d"):
+        try:
+            return datetime.strptime(value, fmt).strftime("%Y-%m-%d")
+        except ValueError:
+            continue
+    return None
+
+
+def _classify_trade_confirmation(text: str, hits: Counter) -> Optional[str]:
+    """Return BuyContract/SellContract when the text is unambiguously a trade confirmation"""
+    # "has bought" always wins, even if the document also mentions selling
+    if hits["BuyPhrase"]:
+        return "BuyContract"
+    if hits["SellPhrase"]:
+        return "SellContract"
+    if hits["BuyTitle"] and not hits["SellTitle"]:
+        return "BuyContract"
+    if hits["SellTitle"] and not hits["BuyTitle"]:
+        return "SellContract"
+    if hits["Confirmation"]:
+        sides = set(_TRADE_SIDE_RE.findall(text))
+        if sides == {"BUY"}:
+            return "BuyContract"
+        if sides == {"SELL"}:
+            return "SellContract"
+    return None
+
+
+def _first_match(patterns: List["re.Pattern[str]"], text: str) -> Optional[str]:
+    """Return the first capture group of the first pattern that matches"""
+    for pattern in patterns:
+        match = pattern.search(text)
+        if match:
+            value = match.group(1).strip()
+            if value:
+                return value
+    return None
+
+
+def _extract_issuer(text: str, doc_type: Optional[str]) -> Optional[str]:
+    """Read the issuer for doc_type with the per-type regexes, skipping blacklisted names"""
+    if doc_type in ("BuyContract", "SellContract"):
+        issuer = _first_match(_TRADE_ISSUER_RES, text)
+        if issuer:
+            issuer = _ISSUER_DESCRIPTOR_RE.sub("", issuer).strip()
+    else:
+        issuer = _first_match(_STATEMENT_ISSUER_RES.get(doc_type, _DEFAULT_ISSUER_RES), text)
+    if not issuer or _is_blacklisted_issuer(issuer, doc_type):
+        return None
+    return issuer
 
 
-def extract_with_llm(text: str, max_chars: int = 2500) -> Optional[Dict[str, Any]]:
+def _extract_typed_fields(text: str, doc_type: str) -> Optional[Dict[str, Any]]:
     """
-    Use LLM to extract document fields from text
-    Returns dict with doc_type, issuer, date_iso, or None if LLM unavailable
+    Read issuer and date_iso for a known doc_type with the per-type regexes
+    Returns None unless both are found
     """
-    if not USE_LLM or not check_llm_available():
+    issuer = _extract_issuer(text, doc_type)
+    if not issuer:
         return None
     
-    # Truncate text to avoid token limits
-    text_sample = text[:max_chars] if len(text) > max_chars else text
+    if doc_type in ("BuyContract", "SellContract"):
+        date_patterns = _TRADE_DATE_RES
+    else:
+        date_patterns = _STATEMENT_DATE_RES.get(doc_type, _DEFAULT_DATE_RES)
+    date_value = _first_match(date_patterns, text)
+    date_iso = _parse_au_date(date_value) if date_value else None
+    if not date_iso:
+        return None
     
-    prompt = f"""You are analysing OCR text from an Australian financial document.
+    return {"doc_type": doc_type, "issuer": issuer, "date_iso": date_iso}
 
-Your job: 
-1. Classify the document.
-2. Extract key fields.
 
-Always follow the rules below EXACTLY.
+def _fast_extract_trade(text: str, hits: Counter) -> Optional[Dict[str, Any]]:
+    """
+    Extract fields from a trade confirmation without calling the LLM
+    Returns None unless doc_type, issuer and date_iso are all found
+    """
+    doc_type = _classify_trade_confirmation(text, hits)
+    if not doc_type:
+        return None
+    return _extract_typed_fields(text, doc_type)
 
-------------------------------------------
-TOP PRIORITY RULES (READ AND OBEY FIRST)
-------------------------------------------
-1. BuyContract: If the document contains "has bought", "bought for you", "bought for", or BOTH "CONFIRMATION" and "BUY", it is ALWAYS a BuyContract. No exceptions.
-   - Look for: "BUY CONFIRMATION", "CONFIRMATION" + "BUY" box, "has bought", "bought for you", "bought for", "We have bought"
-   - Example: Document with "BUY" box and "MIDSEC PTY LTD has bought for you" → ALWAYS BuyContract
-   - CRITICAL: The phrase "has bought" indicates BuyContract. If you see "has bought", it is BuyContract, NOT SellContract.
-2. SellContract: If the document contains "has sold", "sold for you", "sold for", or BOTH "CONFIRMATION" and "SELL" (or "Buy/Sell: SELL"), it is ALWAYS a SellContract. No exceptions.
-   - Look for: "SELL CONFIRMATION", "CONFIRMATION" + "SELL" box, "has sold", "sold for you", "sold for", "We have sold"
-   - CRITICAL: The phrase "has sold" indicates SellContract. If you see "has sold", it is SellContract, NOT BuyContract.
-   - CRITICAL: If document says "has bought" or "bought for you" or any variation of "bought", it is BuyContract, NOT SellContract
-3. NEVER use investor names, broker names, or service provider names (CommSec, JBWere, Ord Minnett, Morgan Stanley Fund Services, Computershare, Link Market Services, etc.) as issuer.
-4. For Share Summary/HoldingStatement documents: Extract the ACTUAL FUND NAME from the document title (e.g., "Highwest Global Offshore Fund, Ltd."), NOT the service provider name (e.g., "Morgan Stanley Fund Services").
-5. For BuyContract/SellContract: ALWAYS use "Trade Date" or "Confirmation Date" for date_iso. NEVER use "Settlement Date" - it is a FUTURE date (usually 5-7 days after trade date).
-6. Only use information found IN THIS document. Ignore any previous documents.
-7. Output MUST be valid JSON. No explanation, no markdown, no backticks.
 
-------------------------------------------
-OUTPUT FORMAT (EXTRACTION MODE)
-------------------------------------------
-Return ONLY this JSON object:
+def _classify_statement(hits: Counter) -> Optional[str]:
+    """
+    Return the statement type with the most keyword hits, or a known combination
+    The winner needs at least twice the hits of the runner-up; closer calls go to the LLM
+    Untitled text with holder ids (HIN/SRN/CHESS) and "holding(s)" is a HoldingStatement
+    """
+    labels = frozenset(label for label in _STATEMENT_LABELS if hits[label])
+    if not labels and hits["HolderHint"] and hits["HoldingHint"]:
+        return "HoldingStatement"
+    combined = _STATEMENT_COMBINATIONS.get(labels)
+    if combined:
+        return combined
+    ranked = sorted(((hits[label], label) for label in labels), reverse=True)
+    if not ranked:
+        return None
+    if len(ranked) == 1 or ranked[0][0] >= 2 * ranked[1][0]:
+        return ranked[0][1]
+    return None
 
-{{
-  "doc_type": "DividendStatement|DistributionStatement|CapitalCallStatement|CallAndDistributionStatement|PeriodicStatement|BankStatement|BuyContract|SellContract|HoldingStatement|TaxStatement|NetAssetSummaryStatement|FinancialStatement|Other|null",
-  "issuer": "fund/product/company name or null",
-  "date_iso": "YYYY-MM-DD or null"
-}}
 
-------------------------------------------
-DOCUMENT CLASSIFICATION RULES
-------------------------------------------
+def _fast_extract_statement(text: str, hits: Counter) -> Optional[Dict[str, Any]]:
+    """
+    Extract fields from an unambiguously titled statement without calling the LLM
+    Returns None unless doc_type, issuer and date_iso are all found
+    """
+    doc_type = _classify_statement(hits)
+    if not doc_type:
+        return None
+    return _extract_typed_fields(text, doc_type)
 
-BuyContract
-- CRITICAL: If document contains ANY of these, it is ALWAYS BuyContract:
-  * "BUY CONFIRMATION" or "CONFIRMATION" + "BUY" (in title, header, or box)
-  * "has bought" or "has bought for you" or "bought for you" or "bought for"
-  * "We have bought" or "We have bought for you" or "We have bought for"
-  * "MIDSEC PTY LTD has bought for you" or similar broker name + "has bought"
-  * "COMPANY:" field with "has bought" text nearby
-  * Any phrase containing "bought" in the context of a transaction
-- Keywords: "CONFIRMATION" + "BUY", "We have bought", "Contract Note", "Brokerage", "Consideration"
-- Securities may include "FUND" or "ETF" — still a BuyContract if confirmation + buy exists
-- If you see "CONFIRMATION" AND "BUY", it is ALWAYS BuyContract, NEVER DistributionStatement, NEVER SellContract
-- CRITICAL: The phrase "has bought" indicates BuyContract. If you see "has bought", it is BuyContract, NOT SellContract.
-- Examples:
-  * Document with "BUY" box and "MIDSEC PTY LTD has bought for you" → BuyContract
-  * Document with "BUY CONFIRMATION" title → BuyContract
-  * Document with "CONFIRMATION" and "has bought" text → BuyContract
-  * Document with "MIDSEC PTY LTD has bought for you" and "COMPANY: DEXUS" → BuyContract
-  * Document with "MIDSEC PTY LTD has bought for you" and "MUNRO GLOBAL GROWTH FUND COMPLEX ETF" → BuyContract
-
-SellContract
-- CRITICAL: If document contains ANY of these, it is ALWAYS SellContract:
-  * "SELL CONFIRMATION" or "CONFIRMATION" + "SELL" (in title, header, or box)
-  * "has sold" or "has sold for you" or "sold for you" or "sold for"
-  * "We have sold" or "We have sold for you" or "We have sold for"
-  * "Buy/Sell: SELL" or "Buy/Sell:SELL"
-  * "We confirm your SALE" or "confirm your sale"
-- Keywords: "CONFIRMATION" + "SELL", "Buy/Sell: SELL", "We have sold", "We confirm your SALE", "Contract Note"
-- If you see "TRADE CONFIRMATION" AND "SELL", it is ALWAYS SellContract
-- CRITICAL: The phrase "has sold" indicates SellContract. If you see "has sold", it is SellContract, NOT BuyContract.
-- CRITICAL: If document says "has bought" or "bought for you" or any variation of "bought", it is BuyContract, NOT SellContract
-- Examples:
-  * Document with "SELL" box and "We have sold" → SellContract
-  * Document with "SELL CONFIRMATION" title → SellContract
-  * Document with "CONFIRMATION" and "has sold" text → SellContract
-  * Document with "has bought" → BuyContract (NOT SellContract, even if filename says "Sell")
-
-DividendStatement
-- Keywords: "Dividend Statement", "Dividend Payment", "Record Date", "Payment Date"
-
-DistributionStatement
-- Keywords: "Distribution Statement/Advice", "Distribution Payment", "Net Distribution"
-- NOT a DistributionStatement if the document contains BUY CONFIRMATION keywords
-
-CapitalCallStatement
-- Keywords: "Capital Call", "Notice of Capital Call", "Amount Due"
-- ONLY if there is NO "Distribution" content
-
-CallAndDistributionStatement
-- Document includes BOTH Capital Call AND Distribution information
-
-HoldingStatement
-- Keywords: "CHESS", "HIN", "SRN", "Holdings", "Portfolio Summary", "Shareholding Statement"
-- NOT valid if trade confirmation keywords appear
-
-BankStatement
-- Keywords: "Bank Statement", account summary, BSB
-- NOT a bank statement if "confirmation", "contract note", "buy", "sell", "brokerage", "consideration" appear
-
-TaxStatement
-- Keywords: "Tax Statement", "AMIT", "AMMA", "Tax Summary", "NAV & Taxation Statement"
-
-NetAssetSummaryStatement
-- Keywords: "Net Asset Summary", "NAV Summary", "Fund Performance"
-- If NAV + tax info are both present → TaxStatement
-
-FinancialStatement
-- Keywords: "Financial Statements", "Financial Statement", "Directors' Report", "Directors Report", "Annual Report", "Audited Financial Statements", "Consolidated Financial Statements"
-- Look for patterns like: "DIRECTORS' REPORT AND FINANCIAL STATEMENTS", "FOR THE YEAR ENDED", "Financial Statements for the year ended"
-- This is a formal financial reporting document, NOT a periodic statement
-- If document contains "Financial Statements" or "Directors' Report" → FinancialStatement, NOT PeriodicStatement
-
-Other
-- Everything else
 
-------------------------------------------
-ISSUER EXTRACTION RULES
-------------------------------------------
-Issuer must be the FUND/PRODUCT/COMPANY from THIS document.
-
-For BuyContract/SellContract:
-- CRITICAL: You MUST extract the issuer/investment name. Returning null is NOT acceptable unless the document truly has no security information.
-- Extract the INVESTMENT/SECURITY name being bought/sold
-- Prioritise fields in THIS ORDER:
-  1. "COMPANY:" - HIGHEST PRIORITY (e.g., "COMPANY: CLEO DIAGNOSTICS LTD" → "CLEO DIAGNOSTICS LTD")
-  2. "Stock Description:" - HIGH PRIORITY for trade confirmations (e.g., "Stock Description: RUSSELL 2000 INDEX ISHARES" → "RUSSELL 2000 INDEX ISHARES")
-  3. "Security Description:" - PRIMARY field - Look for this in:
-     * Direct format: "Security Description: PERPETUAL DIVERSIFIED INCOME ACTIVE ETF"
-     * Table format: After "WE HAVE BOUGHT/SOLD THE FOLLOWING SECURITIES FOR YOU", find the table row with "Security Description" column
-     * Table row example: "Quantity 25,682 Security Code CRED Security Description BETASHARES AUS INVESTMENT GRADE CORPORATE BOND ETF Price 23.4603"
-       → Extract "BETASHARES AUS INVESTMENT GRADE CORPORATE BOND ETF"
-     * Table row example: "Quantity 39,260 Security Code DIFF Security Description PERPETUAL DIVERSIFIED INCOME ACTIVE ETF Price 10.1300"
-       → Extract "PERPETUAL DIVERSIFIED INCOME ACTIVE ETF"
-     * Extract the FULL name including "ETF", "FUND", "INDEX", "ISHARES" (e.g., "PERPETUAL DIVERSIFIED INCOME ACTIVE ETF", "BETASHARES AUS INVESTMENT GRADE CORPORATE BOND ETF")
-     * The Security Description is usually the longest text in the table row (not Quantity, not Price, not Code)
-  4. Look for security name in table rows - find the row that contains quantity, security code, and a long name (usually the investment name)
-  5. "Investment:", "Security:", "Code:" followed by security name
-- Remove unnecessary descriptors: "ORDINARY FULLY PAID", "FRN", "Callable", coupon details
-- BUT preserve ETF/index names: Keep "INDEX", "ISHARES", "ETF", "FUND" if present (e.g., "PERPETUAL DIVERSIFIED INCOME ACTIVE ETF" should remain complete)
-- DO NOT use broker names (CommSec, JBWere, Ord Minnett, Morgan Stanley, Equity & Super, EquitySuper) or investor names
-- CRITICAL: Do NOT extract legal disclaimers. If extracted name is very long (>100 chars) or contains phrases like "In Australia", "Liability", "Members", "Unless Otherwise Stated", reject it and look for actual investment name
-- CRITICAL: Do NOT extract "Quantity" or other table column headers - extract the actual investment name
-- CRITICAL: If you see a table with columns like "Quantity", "Security Code", "Security Description", "Price", "Consideration" - the investment name is in the "Security Description" column value
-
-For HoldingStatement/Share Summary/NetAssetSummaryStatement:
-- Extract the FUND name from the document TITLE (usually at the top of the document)
-- Look for patterns like: "FUND NAME Share Summary", "FUND NAME, Ltd. Share Summary", "FUND NAME NAV Statement"
-- Examples:
-  * "Highwest Global Offshore Fund, Ltd. Share Summary" → "Highwest Global Offshore Fund, Ltd."
-  * "ABC Investment Fund Share Summary" → "ABC Investment Fund"
-  * "XYZ Fund NAV Statement" → "XYZ Fund"
-- CRITICAL: Extract the ACTUAL FUND NAME, NOT the service provider name
-- DO NOT use service provider names like "Morgan Stanley Fund Services", "Computershare", "Link Market Services" - these are NOT the fund name
-- The fund name is usually the FIRST prominent name in the document title, before words like "Share Summary", "Statement", "NAV", etc.
-
-For DistributionStatement/Distribution Advice:
-- CRITICAL: Extract the ACTUAL FUND NAME, NOT the issuer/trustee/registry name
-- Look for fund name in THIS PRIORITY ORDER:
-  1. "Fund:" field - HIGHEST PRIORITY (e.g., "Fund: Ares Diversified Credit Fund - Class I" → "Ares Diversified Credit Fund - Class I")
-  2. Document title/header - Look for patterns like:
-     * "FUND NAME Distribution Statement"
-     * "FUND NAME Distribution Advice"
-     * "FUND NAME | ABN: ..." (fund name before ABN)
-  3. After "Distribution Statement" or "Distribution Advice" title, look for fund name in the same section
-  4. Look for fund name near "APIR Code" or fund identifiers
-- Examples of CORRECT extraction:
-  * "Ares Diversified Credit Fund - Class I" → "Ares Diversified Credit Fund - Class I"
-  * "Causeway Wholesale Private Debt Income Fund" → "Causeway Wholesale Private Debt Income Fund"
-  * "Fidante" or "AMAL CAUSEWAY TRUSTEES" → These are WRONG (these are issuers/trustees, not fund names)
-- DO NOT use:
-  * Issuer/Trustee names: "Fidante", "AMAL CAUSEWAY TRUSTEES", "Automic", "Computershare", "Link Market Services"
-  * Registry service names: "OIF Registry Services", "Automic Registry Services"
-  * Investor/recipient names
-  * Document labels: "Distribution Statement", "Distribution Advice"
-
-For DividendStatement:
-- Extract the fund/product/company name from document title or main content
-- Look for fund names in document headers or titles
-- Look for company name near "Dividend Statement" title
-- DO NOT use service provider or registry names - use the actual fund/company name
-
-For FinancialStatement:
-- Extract the COMPANY name from the document title/header
-- Look for patterns like: "COMPANY NAME DIRECTORS' REPORT AND FINANCIAL STATEMENTS"
-- Examples:
-  * "BIOSCEPTRE INTERNATIONAL LIMITED DIRECTORS' REPORT AND FINANCIAL STATEMENTS" → "BIOSCEPTRE INTERNATIONAL LIMITED"
-  * "ABC COMPANY LIMITED Financial Statements" → "ABC COMPANY LIMITED"
-- Extract the FULL company name including "LIMITED", "PTY LTD", etc. (do NOT remove suffixes for Financial Statements)
-- The company name is usually the FIRST prominent name in the document title, before "DIRECTORS' REPORT", "FINANCIAL STATEMENTS", etc.
-
-For other document types:
-- Extract the fund/product/company name from document title or main content
-- Look for fund names in document headers or titles
-- DO NOT use service provider or registry names - use the actual fund/company name
+def _guess_doc_type(text: str) -> Optional[str]:
+    """Cheap keyword-only guess at the document type (used to size the LLM token budget)"""
+    hits = _scan_keywords(text)
+    return _classify_trade_confirmation(text, hits) or _classify_statement(hits)
 
+
+def _json_max_tokens(text: str, with_filename: bool = False) -> int:
+    """max_tokens for a JSON-mode extraction of text"""
+    output_tokens = _OUTPUT_TOKENS.get(_guess_doc_type(text))
+    if output_tokens is None:
+        return _JSON_MAX_TOKENS
+    return output_tokens + _REASONING_TOKENS + (_FILENAME_TOKENS if with_filename else 0)
+
+
+def extract_fast(text: str) -> Optional[Dict[str, Any]]:
+    """
+    Extract doc_type, issuer and date_iso with keyword and regex rules only
+    Returns None when the document is ambiguous; callers then fall back to the LLM
+    """
+    hits = _scan_keywords(text)
+    trade_fields = _fast_extract_trade(text, hits)
+    if trade_fields:
+        return trade_fields
+    
+    # Anything that looks like a trade confirmation is left to the LLM
+    if hits["BuyPhrase"] or hits["SellPhrase"] or hits["BuyTitle"] or hits["SellTitle"] or hits["Confirmation"]:
+        return None
+    return _fast_extract_statement(text, hits)
+
+
+def _format_filename(fields: Dict[str, Any]) -> Optional[str]:
+    """Build 'YYYYMMDD - [doc-type-tag] - [issuer].pdf' from extracted fields, or None if any is missing"""
+    date_iso, doc_type, issuer = fields.get("date_iso"), fields.get("doc_type"), fields.get("issuer")
+    if not (isinstance(date_iso, str) and _ISO_DATE_RE.fullmatch(date_iso) and isinstance(doc_type, str) and isinstance(issuer, str) and issuer):
+        return None
+    date = date_iso.replace("-", "")
+    type_tag = _DOC_TYPE_TAGS.get(doc_type, doc_type)
+    issuer = _ISSUER_SUFFIX_RE.sub("", issuer).strip()
+    return f"{date} - {type_tag} - {issuer}.pdf"
+
+
+# Static prompt prefixes, sent as the system message. Keeping them byte-identical
+# across calls (and placing the document text after them) lets providers reuse
+# their prompt-prefix cache instead of re-processing the rules every time.
+# Each rule is stated once; both prefixes are assembled from the same sections.
+_DOC_TYPES = (
+    "DividendStatement|DistributionStatement|CapitalCallStatement|CallAndDistributionStatement|"
+    "PeriodicStatement|BankStatement|BuyContract|SellContract|HoldingStatement|TaxStatement|"
+    "NetAssetSummaryStatement|FinancialStatement|Other|null"
+)
+
+_PROMPT_CORE_RULES = """------------------------------------------
+CORE RULES
 ------------------------------------------
-DATE EXTRACTION RULES
+1. Buy/Sell contracts take precedence over every other type (see CLASSIFICATION).
+2. NEVER use investor, broker, registry, trustee or service provider names as issuer.
+3. Dates are Australian DD/MM/YYYY: the FIRST number is the DAY ("11/07/2025" → "2025-07-11").
+4. Only use information found IN THIS document.
+5. Output MUST be valid JSON only: no markdown, backticks, commentary or extra text."""
+
+_PROMPT_CLASSIFICATION_RULES = """------------------------------------------
+CLASSIFICATION
 ------------------------------------------
-Output must be YYYY-MM-DD.
-Document dates use AU format (DD/MM/YYYY) - CRITICAL: Day comes FIRST, then month, then year.
-When you see "11/07/2025", this means: Day=11, Month=07 (July), Year=2025 → Output "2025-07-11"
-DO NOT confuse with MM/DD/YYYY format - in Australian documents, the FIRST number is always the DAY.
-
-Priority:
-
-DividendStatement:
-  Payment Date → Record Date → Statement Date
-
-DistributionStatement:
-  Payment Date → Record Date → Distribution Date
-
-BuyContract/SellContract:
-  CRITICAL: Use Trade Date or Confirmation Date, NOT Settlement Date
-  Priority order:
-  1. "Trade Date" - HIGHEST PRIORITY (e.g., "Trade Date: 09 May 2025" → "2025-05-09")
-  2. "Confirmation Date" - HIGH PRIORITY (e.g., "Confirmation Date: 11/07/2025" → "2025-07-11")
-  3. "Transaction Date" - MEDIUM PRIORITY
-  4. "Date" field in confirmation section
-  CRITICAL - DO NOT use:
-  - "Settlement Date" - This is a FUTURE date (usually 5-7 days after trade date)
-  - "ASX Settlement Date" - This is also a FUTURE date
-  - "Payment Date" - Wrong field
-  - Any date that is AFTER the trade/confirmation date
-  CRITICAL - Date Format Conversion:
-  - Australian dates are DD/MM/YYYY format (day first, month second)
-  - "11/07/2025" means 11th day of July (month 07), year 2025 → "2025-07-11"
-  - "15/07/2025" means 15th day of July (month 07), year 2025 → "2025-07-15"
-  - DO NOT confuse DD/MM/YYYY with MM/DD/YYYY - in Australia, day comes FIRST
-  Examples:
-  - Document shows "Confirmation date: 11/07/2025" and "Settlement date: 15/07/2025" → Use "2025-07-11" (Confirmation Date, NOT Settlement Date)
-  - Document shows "Trade Date: 09 May 2025" and "Settlement Date: 16 May 2025" → Use "2025-05-09" (Trade Date)
-  - Document shows "Confirmation Date: 13 Nov 2025" and "Settlement Date: 17 Nov 2025" → Use "2025-11-13" (Confirmation Date)
-
-FinancialStatement:
-  Year End Date → "FOR THE YEAR ENDED" date → Statement Date
-  Look for patterns like "FOR THE YEAR ENDED 30 JUNE 2025" → extract "2025-06-30"
-  Australian date format: DD/MM/YYYY or DD MMMM YYYY (e.g., "30 June 2025" → "2025-06-30")
-
-All others:
-  Statement Date or main document date
-
+BuyContract - ALWAYS, whatever else the document contains, if it has any of:
+  "has bought", "bought for you", "bought for", "We have bought", "BUY CONFIRMATION", or "CONFIRMATION" + "BUY" (title, header or box)
+  Also typical: "Contract Note", "Brokerage", "Consideration". Securities named FUND/ETF are still BuyContract.
+SellContract - ALWAYS, if it has any of:
+  "has sold", "sold for you", "sold for", "We have sold", "SELL CONFIRMATION", "CONFIRMATION"/"TRADE CONFIRMATION" + "SELL", "Buy/Sell: SELL", "We confirm your SALE"
+  Any form of "bought" means BuyContract, never SellContract (even if the filename says "Sell").
+DividendStatement - "Dividend Statement", "Dividend Payment", "Record Date", "Payment Date"
+DistributionStatement - "Distribution Statement/Advice", "Distribution Payment", "Net Distribution"
+CapitalCallStatement - "Capital Call", "Notice of Capital Call", "Amount Due"; only if there is NO distribution content
+CallAndDistributionStatement - BOTH capital call AND distribution information
+HoldingStatement - "CHESS", "HIN", "SRN", "Holdings", "Portfolio Summary", "Shareholding Statement", "Share Summary"
+BankStatement - "Bank Statement", account summary, BSB; not if "confirmation", "contract note", "brokerage" or "consideration" appear
+TaxStatement - "Tax Statement", "AMIT", "AMMA", "Tax Summary", "NAV & Taxation Statement"; also NAV + tax info together
+NetAssetSummaryStatement - "Net Asset Summary", "NAV Summary", "Fund Performance"
+FinancialStatement - "Financial Statements", "Directors' Report", "Annual Report", "Audited/Consolidated Financial Statements", "FOR THE YEAR ENDED"; never PeriodicStatement
+Other - everything else
+
+Examples:
+- "BUY" box + "MIDSEC PTY LTD has bought for you" + "COMPANY: DEXUS" → BuyContract
+- "MIDSEC PTY LTD has bought for you" + "MUNRO GLOBAL GROWTH FUND COMPLEX ETF" → BuyContract
+- "SELL" box + "We have sold" → SellContract"""
+
+_PROMPT_ISSUER_RULES = """------------------------------------------
+ISSUER (the FUND/PRODUCT/COMPANY in THIS document; null only if truly absent)
 ------------------------------------------
-RETURN FORMAT
+BuyContract/SellContract - the SECURITY bought/sold, first match wins:
+  1. "COMPANY:" ("COMPANY: CLEO DIAGNOSTICS LTD" → "CLEO DIAGNOSTICS LTD")
+  2. "Stock Description:" ("RUSSELL 2000 INDEX ISHARES")
+  3. "Security Description:" - direct or as a table column after "WE HAVE BOUGHT/SOLD THE FOLLOWING SECURITIES FOR YOU":
+     "Quantity 25,682 Security Code CRED Security Description BETASHARES AUS INVESTMENT GRADE CORPORATE BOND ETF Price 23.4603"
+     → "BETASHARES AUS INVESTMENT GRADE CORPORATE BOND ETF" (the long value, not Quantity/Code/Price or column headers)
+  4. "Investment:", "Security:", "Code:"
+  Drop "ORDINARY FULLY PAID", "FRN", "Callable", coupon details; keep "ETF", "FUND", "INDEX", "ISHARES".
+  Reject legal disclaimers (>100 chars, "In Australia", "Liability", "Members", "Unless Otherwise Stated").
+HoldingStatement/Share Summary/NetAssetSummaryStatement - fund name from the TITLE, before "Share Summary", "Statement", "NAV"
+  ("Highwest Global Offshore Fund, Ltd. Share Summary" → "Highwest Global Offshore Fund, Ltd.")
+DistributionStatement - the FUND, not the trustee/registry: "Fund:" field ("Fund: Ares Diversified Credit Fund - Class I" → "Ares Diversified Credit Fund - Class I"),
+  then the title ("FUND NAME Distribution Statement/Advice", "FUND NAME | ABN: ..."), then near "APIR Code". Never "Distribution Statement" itself.
+FinancialStatement - full company name from the title, suffixes kept
+  ("BIOSCEPTRE INTERNATIONAL LIMITED DIRECTORS' REPORT AND FINANCIAL STATEMENTS" → "BIOSCEPTRE INTERNATIONAL LIMITED")
+All others - fund/product/company name from the title or header"""
+
+_PROMPT_DATE_RULES = """------------------------------------------
+DATE (output YYYY-MM-DD)
 ------------------------------------------
-Return ONLY the JSON object.
-
-Do NOT include:
-- markdown
-- backticks
-- commentary
-- explanation
-- reasoning
-- extra text before or after the JSON
-
-Document text:
-{text_sample}
-
-JSON:"""
-
-    # Token limits: DeepSeek doesn't use reasoning tokens, GPT-5 Nano does
-    # For DeepSeek: 800 tokens is sufficient
-    # For GPT-5 Nano: 1500 tokens needed (400-500 reasoning + 800-1000 content)
-    max_tokens_value = 1500 if LLM_PROVIDER == "openai" else 800
-    response_text = _call_llm_api(prompt, max_tokens=max_tokens_value)
+BuyContract/SellContract: Trade Date → Confirmation Date → Transaction Date → Date in confirmation section
+  NEVER Settlement Date / ASX Settlement Date (a future date) or Payment Date
+  ("Confirmation date: 11/07/2025", "Settlement date: 15/07/2025" → "2025-07-11"; "Trade Date: 09 May 2025" → "2025-05-09")
+DividendStatement: Payment Date → Record Date → Statement Date
+DistributionStatement: Payment Date → Record Date → Distribution Date
+FinancialStatement: year end date ("FOR THE YEAR ENDED 30 JUNE 2025" → "2025-06-30") → Statement Date
+All others: Statement Date or main document date"""
+
+_PROMPT_FILENAME_RULES = """------------------------------------------
+FILENAME
+------------------------------------------
+Format: YYYYMMDD - [doc-type-tag] - [issuer].pdf ("2025-11-13" → "20251113")
+Issuer: original capitalisation, suffixes (Pty Ltd, Pty. Ltd., Limited, Ltd) removed.
+doc-type-tag: DividendStatement → Dividend Statement, DistributionStatement → Distribution Statement,
+CapitalCallStatement → Capital Call, CallAndDistributionStatement → Distribution and Capital Call,
+PeriodicStatement → Periodic Statement, BankStatement → Bank Statement, BuyContract → Buy Contract,
+SellContract → Sell Contract, HoldingStatement → Holding Statement, TaxStatement → Tax Statement,
+NetAssetSummaryStatement → Net Asset Summary, FinancialStatement → Financial Statement"""
+
+_PROMPT_INTRO = "You are analysing OCR text from an Australian financial document. Follow the rules below EXACTLY."
+
+_EXTRACT_PROMPT_PREFIX = "\n\n".join([
+    _PROMPT_INTRO,
+    _PROMPT_CORE_RULES,
+    'Return ONLY: {"doc_type": "' + _DOC_TYPES + '", "issuer": "name or null", "date_iso": "YYYY-MM-DD or null"}',
+    _PROMPT_CLASSIFICATION_RULES,
+    _PROMPT_ISSUER_RULES,
+    _PROMPT_DATE_RULES,
+])
+
+# Several documents per request: the same rules, one result object per document
+_EXTRACT_PACKED_PROMPT_PREFIX = "\n\n".join([
+    _PROMPT_INTRO,
+    'The text holds several documents, each starting with "<<<DOC n>>>". Apply the rules to each document on its own.',
+    _PROMPT_CORE_RULES,
+    'Return ONLY: {"results": [one object per document, in order: {"doc_type": "' + _DOC_TYPES + '", '
+    '"issuer": "name or null", "date_iso": "YYYY-MM-DD or null"}]}',
+    _PROMPT_CLASSIFICATION_RULES,
+    _PROMPT_ISSUER_RULES,
+    _PROMPT_DATE_RULES,
+])
+
+_EXTRACT_AND_FILENAME_PROMPT_PREFIX = "\n\n".join([
+    _PROMPT_INTRO,
+    _PROMPT_CORE_RULES,
+    'Return ONLY: {"doc_type": "' + _DOC_TYPES + '", "issuer": "name or null", "date_iso": "YYYY-MM-DD or null", '
+    '"suggested_filename": "YYYYMMDD - [doc-type-tag] - [issuer].pdf or null"}',
+    _PROMPT_CLASSIFICATION_RULES,
+    _PROMPT_ISSUER_RULES,
+    _PROMPT_DATE_RULES,
+    _PROMPT_FILENAME_RULES,
+])
+
+
+# Per-document part of the extraction prompts: _EXTRACT_PROMPT_HEAD + text + _EXTRACT_PROMPT_TAIL
+_EXTRACT_PROMPT_HEAD = "Document text:\n"
+_EXTRACT_PROMPT_TAIL = "\n\nJSON:"
+
+
+def _slice_for_llm(text: str, max_chars: int, tail_chars: int = 600) -> str:
+    """
+    Trim text to max_chars, keeping the head of the document plus a short tail
+    Titles, parties and trade details sit at the top; totals and dates often at the end
+    """
+    if len(text) <= max_chars:
+        return text
+    tail_chars = min(tail_chars, max_chars // 3)
+    return text[:max_chars - tail_chars] + "\n...\n" + text[-tail_chars:]
+
+
+# Field labels and titles the rules key on; lines around them carry the answer
+_CONTEXT_TRIGGERS = [kw for kws in _DOC_KEYWORDS.values() for kw in kws] + [
+    "company:", "stock description", "security description", "fund:", "fund name", "apir", "abn",
+    "trade date", "confirmation date", "transaction date", "payment date", "record date",
+    "statement date", "distribution date", "due date", "share summary", "nav statement",
+]
+_CONTEXT_TRIGGER_RE = re.compile(
+    # (?!\w) rather than \b so that "abn" skips "abnormal" while "company:" still matches
+    r"\b(?:" + "|".join(re.escape(kw) for kw in sorted(set(_CONTEXT_TRIGGERS), key=len, reverse=True)) + r")(?!\w)",
+    re.I
+)
+
+
+def _condense_for_llm(text: str, max_chars: int, context_lines: int = 2, head_lines: int = 5) -> Optional[str]:
+    """
+    Keep the title block plus the lines around every rulebook keyword, dropping disclaimers and footers
+    Returns None when no keyword is found or no line would be dropped
+    """
+    lines = text.splitlines()
+    line_starts = []
+    offset = 0
+    for line in lines:
+        line_starts.append(offset)
+        offset += len(line) + 1
+    
+    keep = set(range(min(head_lines, len(lines))))
+    found = False
+    for match in _CONTEXT_TRIGGER_RE.finditer(text):
+        found = True
+        index = bisect_right(line_starts, match.start()) - 1
+        keep.update(range(max(0, index - context_lines), min(len(lines), index + context_lines + 1)))
+    # Nothing to drop (e.g. OCR text without line breaks): let the caller slice instead
+    if not found or len(keep) == len(lines):
+        return None
+    condensed = "\n".join(lines[i] for i in sorted(keep) if lines[i].strip())
+    if len(condensed) <= max_chars:
+        return condensed
+    # Cut at the last line break under the budget rather than mid-line
+    cut = condensed.rfind("\n", 0, max_chars + 1)
+    return condensed[:cut] if cut > 0 else condensed[:max_chars]
+
+
+# OCR layout noise: runs of spaces/tabs/form feeds and page-number lines
+_HSPACE_RE = re.compile(r"[^\S\n]+")
+_PAGE_MARKER_RE = re.compile(r"(?:page\s*\d+(?:\s*(?:of|/)\s*\d+)?|-\s*\d+\s*-)", re.I)
+# A bare "n/m" is only a page counter without leading zeros, m <= 999 and n <= m;
+# "30/06" or "07/2025" are split dates
+_PAGE_FRACTION_RE = re.compile(r"([1-9]\d{0,2})\s*/\s*([1-9]\d{0,2})")
+
+
+def _is_page_marker(line: str) -> bool:
+    """True for 'Page 2', 'Page 2 of 5', '- 2 -' and page counters such as '2/5'"""
+    if _PAGE_MARKER_RE.fullmatch(line):
+        return True
+    fraction = _PAGE_FRACTION_RE.fullmatch(line)
+    return fraction is not None and int(fraction.group(1)) <= int(fraction.group(2))
+
+
+def _normalize_ocr_text(text: str) -> str:
+    """Collapse whitespace and drop blank, page-number and repeated consecutive lines"""
+    lines = []
+    previous = None
+    for line in _HSPACE_RE.sub(" ", text).split("\n"):
+        line = line.strip()
+        if not line or line == previous or _is_page_marker(line):
+            continue
+        lines.append(line)
+        previous = line
+    return "\n".join(lines)
+
+
+@lru_cache(maxsize=1)
+def _token_encoding() -> Optional[Any]:
+    """tiktoken encoding for LLM_TOKEN_BUDGET, or None when tiktoken is not installed"""
+    try:
+        import tiktoken  # type: ignore
+    except ImportError:
+        logger.warning("LLM_TOKEN_BUDGET is set but tiktoken is not installed, trimming by characters")
+        return None
+    return tiktoken.get_encoding("cl100k_base")
+
+
+def _trim_to_tokens(text: str, budget: int, encoding: Any) -> str:
+    """Token-space variant of _slice_for_llm: head plus a tail of at most a third of the budget"""
+    ids = encoding.encode(text, disallowed_special=())
+    if len(ids) <= budget:
+        return text
+    tail = budget // 3
+    if not tail:
+        # Too small a budget to split (ids[-0:] would be the whole document)
+        return encoding.decode(ids[:budget])
+    return encoding.decode(ids[:budget - tail]) + "\n...\n" + encoding.decode(ids[len(ids) - tail:])
+
+
+def _sample_for_llm(text: str, max_chars: int) -> str:
+    """Trim long text to the keyword windows, or head + tail when nothing matches"""
+    # Layout whitespace and page furniture cost tokens without carrying any field
+    text = _normalize_ocr_text(text)
+    encoding = _token_encoding() if LLM_TOKEN_BUDGET > 0 else None
+    if encoding is not None:
+        # Characters are only a coarse pre-cut here (tokens average ~4 chars); the budget decides
+        max_chars = LLM_TOKEN_BUDGET * 8
+    text_sample = text if len(text) <= max_chars else _condense_for_llm(text, max_chars)
+    if text_sample is None:
+        text_sample = _slice_for_llm(text, max_chars)
+    if encoding is not None:
+        text_sample = _trim_to_tokens(text_sample, LLM_TOKEN_BUDGET, encoding)
+    return text_sample
+
+
+def _build_extract_prompt(text: str, max_chars: int) -> str:
+    """Build the per-document part of the extraction prompt (the rules live in the system prefix)"""
+    return _EXTRACT_PROMPT_HEAD + _sample_for_llm(text, max_chars) + _EXTRACT_PROMPT_TAIL
+
+
+def _build_packed_prompt(texts: List[str], max_chars: int) -> str:
+    """Build one prompt holding several documents, each marked <<<DOC n>>>"""
+    parts = [_EXTRACT_PROMPT_HEAD]
+    for number, text in enumerate(texts, 1):
+        parts.append(f"<<<DOC {number}>>>\n{_sample_for_llm(text, max_chars)}\n")
+    parts.append(_EXTRACT_PROMPT_TAIL)
+    return "".join(parts)
+
+
+_JSON_DECODER = json.JSONDecoder()
+
+
+def _extract_first_json(response_text: str) -> Optional[Dict[str, Any]]:
+    """
+    Decode the first JSON object in an LLM response
+    Tolerates markdown code fences and commentary before or after the object
+    """
+    # JSON-mode replies are normally the bare object: parse them in one orjson call
+    if orjson is not None and response_text.startswith("{"):
+        try:
+            extracted = orjson.loads(response_text)
+            return extracted if isinstance(extracted, dict) else None
+        except orjson.JSONDecodeError:
+            pass
+    start = response_text.find("{")
+    if start < 0:
+        return None
+    try:
+        extracted, _ = _JSON_DECODER.raw_decode(response_text, start)
+    except json.JSONDecodeError:
+        return None
+    return extracted if isinstance(extracted, dict) else None
+
+
+def _parse_extract_response(response_text: Optional[str]) -> Optional[Dict[str, Any]]:
+    """Parse the extraction JSON returned by the LLM"""
     if not response_text:
         return None
     
-    # Extract JSON from response (handle markdown code blocks)
-    if "```json" in response_text:
-        response_text = response_text.split("```json")[1].split("```")[0].strip()
-    elif "```" in response_text:
-        response_text = response_text.split("```")[1].split("```")[0].strip()
+    extracted = _extract_first_json(response_text)
+    if extracted is None:
+        logger.warning("LLM JSON parsing failed: %s", response_text[:200])
+        return None
+    return _clean_extract_fields(extracted)
+
+
+# Fields of an extraction reply; missing, empty and "null" values all become None
+_EXTRACT_KEYS = ("doc_type", "issuer", "date_iso")
+_EXTRACT_AND_FILENAME_KEYS = _EXTRACT_KEYS + ("suggested_filename",)
+_NULL_VALUES = ("", "null")
+_ISO_DATE_RE = re.compile(r"\d{4}-\d{2}-\d{2}")
+
+
+def _clean_extract_fields(extracted: Dict[str, Any], keys: Tuple[str, ...] = _EXTRACT_KEYS) -> Dict[str, Any]:
+    """Normalise one extraction object: non-strings, "null" strings and blacklisted issuers become None"""
+    result = {
+        key: value if isinstance(value, str) and value not in _NULL_VALUES else None
+        for key, value in ((key, extracted.get(key)) for key in keys)
+    }
+    if result["issuer"] and _is_blacklisted_issuer(result["issuer"], result["doc_type"]):
+        result["issuer"] = None
+    if result["date_iso"] and not _ISO_DATE_RE.fullmatch(result["date_iso"]):
+        result["date_iso"] = None
+    return result
+
+
+def _replace_rejected_issuer(result: Optional[Dict[str, Any]], text: str) -> Optional[Dict[str, Any]]:
+    """Fill an issuer rejected by the blacklist from the per-type regexes"""
+    if not result or result["issuer"] or not result["doc_type"]:
+        return result
+    result["issuer"] = _extract_issuer(text, result["doc_type"])
+    if "suggested_filename" in result and not result["suggested_filename"] and result["issuer"] and result["date_iso"]:
+        result["suggested_filename"] = _format_filename(result)
+    return result
+
+
+# Routing model prompt: classification only, a fraction of the full rulebook
+_ROUTER_PROMPT_PREFIX = (
+    "Classify this Australian financial document. "
+    "Any document with \"has bought\"/\"has sold\" or CONFIRMATION + BUY/SELL is a BuyContract/SellContract. "
+    'Return ONLY JSON: {"doc_type": "' + _DOC_TYPES + '"}'
+)
+
+
+def classify_doc_type(text: str, max_chars: int = 1000) -> Optional[str]:
+    """
+    Classify a document with the small LLM_ROUTER_MODEL
+    Returns None if routing is disabled or the label is Other/unknown
+    """
+    if not LLM_ROUTER_MODEL:
+        return None
+    response_text = _call_llm_api(
+        _build_extract_prompt(text, max_chars), max_tokens=LLM_ROUTER_MAX_TOKENS,
+        system=_ROUTER_PROMPT_PREFIX, json_mode=True, model=LLM_ROUTER_MODEL
+    )
+    return _parse_router_response(response_text)
+
+
+async def classify_doc_type_async(text: str, max_chars: int = 1000) -> Optional[str]:
+    """Async variant of classify_doc_type"""
+    if not LLM_ROUTER_MODEL:
+        return None
+    response_text = await _call_llm_api_async(
+        _build_extract_prompt(text, max_chars), max_tokens=LLM_ROUTER_MAX_TOKENS,
+        system=_ROUTER_PROMPT_PREFIX, json_mode=True, model=LLM_ROUTER_MODEL
+    )
+    return _parse_router_response(response_text)
+
+
+def _parse_router_response(response_text: Optional[str]) -> Optional[str]:
+    """Return the routed doc_type if it is one of the known document types"""
+    extracted = _extract_first_json(response_text) if response_text else None
+    doc_type = extracted.get("doc_type") if extracted else None
+    return doc_type if doc_type in _DOC_TYPE_TAGS else None
+
+
+def _extract_with_router(text: str) -> Optional[Dict[str, Any]]:
+    """Routing model label + per-type regexes; None means the main model is needed"""
+    doc_type = classify_doc_type(text)
+    return _extract_typed_fields(text, doc_type) if doc_type else None
+
+
+async def _extract_with_router_async(text: str) -> Optional[Dict[str, Any]]:
+    """Async variant of _extract_with_router"""
+    doc_type = await classify_doc_type_async(text)
+    return _extract_typed_fields(text, doc_type) if doc_type else None
+
+
+def _call_llm_json(prompt: str, system: str, max_tokens: int) -> Optional[str]:
+    """JSON-mode LLM call; an empty or cut-off reply is retried once with twice the token budget"""
+    response_text = _call_llm_api(prompt, max_tokens=max_tokens, system=system, json_mode=True)
+    if response_text is not None and _extract_first_json(response_text) is None:
+        response_text = _call_llm_api(prompt, max_tokens=max_tokens * 2, system=system, json_mode=True)
+    return response_text
+
+
+async def _call_llm_json_async(prompt: str, system: str, max_tokens: int) -> Optional[str]:
+    """Async variant of _call_llm_json"""
+    response_text = await _call_llm_api_async(prompt, max_tokens=max_tokens, system=system, json_mode=True)
+    if response_text is not None and _extract_first_json(response_text) is None:
+        response_text = await _call_llm_api_async(prompt, max_tokens=max_tokens * 2, system=system, json_mode=True)
+    return response_text
+
+
+def _project_extract_fields(result: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """Drop the filename from a combined result, leaving the extraction fields"""
+    return {key: result.get(key) for key in _EXTRACT_KEYS} if result else None
+
+
+def extract_with_llm(text: str, max_chars: int = 1200) -> Optional[Dict[str, Any]]:
+    """
+    Deprecated: use extract_and_suggest_filename_with_llm
+    Returns dict with doc_type, issuer, date_iso from the combined call, or None if LLM unavailable
+    """
+    warnings.warn("extract_with_llm is deprecated, use extract_and_suggest_filename_with_llm", DeprecationWarning, stacklevel=2)
+    return _project_extract_fields(extract_and_suggest_filename_with_llm(text, max_chars))
+
+
+async def extract_with_llm_async(text: str, max_chars: int = 1200) -> Optional[Dict[str, Any]]:
+    """Deprecated: use extract_and_suggest_filename_with_llm_async"""
+    warnings.warn("extract_with_llm_async is deprecated, use extract_and_suggest_filename_with_llm_async", DeprecationWarning, stacklevel=2)
+    return _project_extract_fields(await extract_and_suggest_filename_with_llm_async(text, max_chars))
+
+
+async def extract_with_llm_batch(texts: List[str], max_chars: int = 1200) -> List[Optional[Dict[str, Any]]]:
+    """
+    Extract fields for several documents concurrently
+    Results are returned in the same order as texts
+    Ollama only decodes OLLAMA_NUM_PARALLEL requests at once; the rest queue server-side
+    """
+    results = await asyncio.gather(*(extract_and_suggest_filename_with_llm_async(text, max_chars) for text in texts))
+    return [_project_extract_fields(result) for result in results]
+
+
+def extract_with_llm_packed(texts: List[str], max_chars: int = 1200, pack_size: int = LLM_PACK_SIZE) -> List[Optional[Dict[str, Any]]]:
+    """
+    Extract fields for several documents, packing up to pack_size of them into each LLM request
+    A pack whose reply does not hold one object per document is retried one document at a time
+    """
+    if not USE_LLM or not check_llm_available():
+        return [None] * len(texts)
     
-    # Try to parse JSON
-    try:
-        extracted = json.loads(response_text)
-        # Validate and clean extracted data
-        return {
-            "doc_type": extracted.get("doc_type") if extracted.get("doc_type") != "null" else None,
-            "issuer": extracted.get("issuer") if extracted.get("issuer") != "null" else None,
-            "date_iso": extracted.get("date_iso") if extracted.get("date_iso") != "null" else None
-        }
-    except json.JSONDecodeError:
-        # If JSON parsing fails, try to extract fields manually
-        print(f"LLM JSON parsing failed: {response_text[:200]}")
+    results: List[Optional[Dict[str, Any]]] = [extract_fast(text) for text in texts]
+    pending = [index for index, result in enumerate(results) if result is None]
+    for start in range(0, len(pending), pack_size):
+        pack = pending[start:start + pack_size]
+        packed = None
+        if len(pack) > 1:
+            response_text = _call_llm_json(
+                _build_packed_prompt([texts[index] for index in pack], max_chars),
+                _EXTRACT_PACKED_PROMPT_PREFIX, sum(_json_max_tokens(texts[index]) for index in pack)
+            )
+            packed = _parse_packed_response(response_text, len(pack))
+        if packed is None:
+            for index in pack:
+                results[index] = _project_extract_fields(extract_and_suggest_filename_with_llm(texts[index], max_chars))
+            continue
+        for index, result in zip(pack, packed):
+            results[index] = _replace_rejected_issuer(result, texts[index])
+    return results
+
+
+def _parse_packed_response(response_text: Optional[str], count: int) -> Optional[List[Dict[str, Any]]]:
+    """Parse a packed reply; None unless it holds exactly count result objects"""
+    extracted = _extract_first_json(response_text) if response_text else None
+    items = extracted.get("results") if extracted else None
+    if not isinstance(items, list) or len(items) != count or not all(isinstance(item, dict) for item in items):
+        logger.warning("Packed LLM reply unusable, extracting %d documents one by one", count)
         return None
+    return [_clean_extract_fields(item) for item in items]
     
 
-def extract_and_suggest_filename_with_llm(text: str, max_chars: int = 2500) -> Optional[Dict[str, Any]]:
+def extract_and_suggest_filename_with_llm(text: str, max_chars: int = 1200) -> Optional[Dict[str, Any]]:
     """
     Combined LLM call: Extract fields AND suggest filename in one request
     This reduces HTTP overhead and improves speed
@@ -484,615 +1604,394 @@ def extract_and_suggest_filename_with_llm(text: str, max_chars: int = 2500) -> O
     if not USE_LLM or not check_llm_available():
         return None
     
-    # Truncate text to avoid token limits
-    text_sample = text[:max_chars] if len(text) > max_chars else text
+    fast_result = extract_fast(text) or _extract_with_router(text)
+    if fast_result:
+        fast_result["suggested_filename"] = _format_filename(fast_result)
+        return fast_result
     
-    prompt = f"""You are analysing OCR text from an Australian financial document.
+    prompt = _build_extract_prompt(text, max_chars)
+    response_text = _call_llm_json(prompt, _EXTRACT_AND_FILENAME_PROMPT_PREFIX, _json_max_tokens(text, with_filename=True))
+    return _replace_rejected_issuer(_parse_extract_and_filename_response(response_text), text)
 
-Your job: 
-1. Classify the document.
-2. Extract key fields.
-3. Suggest a filename.
 
-Always follow the rules below EXACTLY.
+async def extract_and_suggest_filename_with_llm_async(text: str, max_chars: int = 1200) -> Optional[Dict[str, Any]]:
+    """
+    Async variant of extract_and_suggest_filename_with_llm
+    Lets callers overlap LLM round-trips for several documents
+    """
+    if not USE_LLM or not await check_llm_available_async():
+        return None
+    
+    fast_result = extract_fast(text) or await _extract_with_router_async(text)
+    if fast_result:
+        fast_result["suggested_filename"] = _format_filename(fast_result)
+        return fast_result
+    
+    if LLM_BATCH_WINDOW_MS > 0:
+        return await _get_batcher(max_chars).submit(text)
+    return await _extract_and_suggest_llm_async(text, max_chars)
 
-------------------------------------------
-TOP PRIORITY RULES (READ AND OBEY FIRST)
-------------------------------------------
-1. BuyContract: If the document contains "has bought", "bought for you", "bought for", or BOTH "CONFIRMATION" and "BUY", it is ALWAYS a BuyContract. No exceptions.
-   - Look for: "BUY CONFIRMATION", "CONFIRMATION" + "BUY" box, "has bought", "bought for you", "bought for", "We have bought"
-   - Example: Document with "BUY" box and "MIDSEC PTY LTD has bought for you" → ALWAYS BuyContract
-   - CRITICAL: The phrase "has bought" indicates BuyContract. If you see "has bought", it is BuyContract, NOT SellContract.
-2. SellContract: If the document contains "has sold", "sold for you", "sold for", or BOTH "CONFIRMATION" and "SELL" (or "Buy/Sell: SELL"), it is ALWAYS a SellContract. No exceptions.
-   - Look for: "SELL CONFIRMATION", "CONFIRMATION" + "SELL" box, "has sold", "sold for you", "sold for", "We have sold"
-   - CRITICAL: The phrase "has sold" indicates SellContract. If you see "has sold", it is SellContract, NOT BuyContract.
-   - CRITICAL: If document says "has bought" or "bought for you" or any variation of "bought", it is BuyContract, NOT SellContract
-3. NEVER use investor names, broker names, or service provider names (CommSec, JBWere, Ord Minnett, Morgan Stanley Fund Services, Computershare, Link Market Services, etc.) as issuer.
-4. For Share Summary/HoldingStatement documents: Extract the ACTUAL FUND NAME from the document title (e.g., "Highwest Global Offshore Fund, Ltd."), NOT the service provider name (e.g., "Morgan Stanley Fund Services").
-5. For BuyContract/SellContract: ALWAYS use "Trade Date" or "Confirmation Date" for date_iso. NEVER use "Settlement Date" - it is a FUTURE date (usually 5-7 days after trade date).
-6. Only use information found IN THIS document. Ignore any previous documents.
-7. Output MUST be valid JSON. No explanation, no markdown, no backticks.
 
-------------------------------------------
-OUTPUT FORMAT (EXTRACTION + FILENAME MODE)
-------------------------------------------
-Return ONLY this JSON object:
+async def _extract_and_suggest_llm_async(text: str, max_chars: int) -> Optional[Dict[str, Any]]:
+    """Single-document combined LLM call (no fast path)"""
+    prompt = _build_extract_prompt(text, max_chars)
+    response_text = await _call_llm_json_async(prompt, _EXTRACT_AND_FILENAME_PROMPT_PREFIX, _json_max_tokens(text, with_filename=True))
+    return _replace_rejected_issuer(_parse_extract_and_filename_response(response_text), text)
 
-{{
-  "doc_type": "DividendStatement|DistributionStatement|CapitalCallStatement|CallAndDistributionStatement|PeriodicStatement|BankStatement|BuyContract|SellContract|HoldingStatement|TaxStatement|NetAssetSummaryStatement|FinancialStatement|Other|null",
-  "issuer": "fund/product/company name or null",
-  "date_iso": "YYYY-MM-DD or null",
-  "suggested_filename": "YYYYMMDD - [doc-type-tag] - [issuer].pdf or null"
-}}
 
-------------------------------------------
-DOCUMENT CLASSIFICATION RULES
-------------------------------------------
+async def _extract_and_suggest_packed_async(texts: List[str], max_chars: int) -> List[Optional[Dict[str, Any]]]:
+    """
+    Combined results for several documents from one packed request
+    Filenames are built locally from the fields; an unusable reply falls back to one call per document
+    """
+    response_text = await _call_llm_json_async(
+        _build_packed_prompt(texts, max_chars),
+        _EXTRACT_PACKED_PROMPT_PREFIX, sum(_json_max_tokens(text) for text in texts)
+    )
+    packed = _parse_packed_response(response_text, len(texts))
+    if packed is None:
+        return list(await asyncio.gather(*(_extract_and_suggest_llm_async(text, max_chars) for text in texts)))
+    results: List[Optional[Dict[str, Any]]] = []
+    for text, result in zip(texts, packed):
+        result = _replace_rejected_issuer(result, text)
+        if result is not None:
+            result["suggested_filename"] = _format_filename(result)
+        results.append(result)
+    return results
+
+
+class _LLMBatcher:
+    """Collects combined calls for LLM_BATCH_WINDOW_MS and sends them as one packed request"""
+
+    def __init__(self, max_chars: int, window: float, max_size: int):
+        self.max_chars = max_chars
+        self.window = window
+        self.max_size = max_size
+        self._queue: "Optional[asyncio.Queue[Tuple[str, asyncio.Future[Optional[Dict[str, Any]]]]]]" = None
+        self._collector: "Optional[asyncio.Task[None]]" = None
+        self._dispatches: "set[asyncio.Task[None]]" = set()
+
+    async def submit(self, text: str) -> Optional[Dict[str, Any]]:
+        loop = asyncio.get_running_loop()
+        if self._collector is None or self._collector.done() or self._collector.get_loop() is not loop:
+            self._queue = asyncio.Queue()
+            self._collector = loop.create_task(self._collect())
+        future: "asyncio.Future[Optional[Dict[str, Any]]]" = loop.create_future()
+        self._queue.put_nowait((text, future))
+        return await future
+
+    async def _collect(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.window
+            while len(batch) < self.max_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            # Keep collecting the next batch while this one is in flight
+            task = loop.create_task(self._dispatch(batch))
+            self._dispatches.add(task)
+            task.add_done_callback(self._dispatches.discard)
 
-BuyContract
-- CRITICAL: If document contains ANY of these, it is ALWAYS BuyContract:
-  * "BUY CONFIRMATION" or "CONFIRMATION" + "BUY" (in title, header, or box)
-  * "has bought" or "has bought for you" or "bought for you" or "bought for"
-  * "We have bought" or "We have bought for you" or "We have bought for"
-  * "MIDSEC PTY LTD has bought for you" or similar broker name + "has bought"
-  * "COMPANY:" field with "has bought" text nearby
-  * Any phrase containing "bought" in the context of a transaction
-- Keywords: "CONFIRMATION" + "BUY", "We have bought", "Contract Note", "Brokerage", "Consideration"
-- Securities may include "FUND" or "ETF" — still a BuyContract if confirmation + buy exists
-- If you see "CONFIRMATION" AND "BUY", it is ALWAYS BuyContract, NEVER DistributionStatement, NEVER SellContract
-- CRITICAL: The phrase "has bought" indicates BuyContract. If you see "has bought", it is BuyContract, NOT SellContract.
-- Examples:
-  * Document with "BUY" box and "MIDSEC PTY LTD has bought for you" → BuyContract
-  * Document with "BUY CONFIRMATION" title → BuyContract
-  * Document with "CONFIRMATION" and "has bought" text → BuyContract
-  * Document with "MIDSEC PTY LTD has bought for you" and "COMPANY: DEXUS" → BuyContract
-  * Document with "MIDSEC PTY LTD has bought for you" and "MUNRO GLOBAL GROWTH FUND COMPLEX ETF" → BuyContract
-
-SellContract
-- CRITICAL: If document contains ANY of these, it is ALWAYS SellContract:
-  * "SELL CONFIRMATION" or "CONFIRMATION" + "SELL" (in title, header, or box)
-  * "has sold" or "has sold for you" or "sold for you" or "sold for"
-  * "We have sold" or "We have sold for you" or "We have sold for"
-  * "Buy/Sell: SELL" or "Buy/Sell:SELL"
-  * "We confirm your SALE" or "confirm your sale"
-- Keywords: "CONFIRMATION" + "SELL", "Buy/Sell: SELL", "We have sold", "We confirm your SALE", "Contract Note"
-- If you see "TRADE CONFIRMATION" AND "SELL", it is ALWAYS SellContract
-- CRITICAL: The phrase "has sold" indicates SellContract. If you see "has sold", it is SellContract, NOT BuyContract.
-- CRITICAL: If document says "has bought" or "bought for you" or any variation of "bought", it is BuyContract, NOT SellContract
-- Examples:
-  * Document with "SELL" box and "We have sold" → SellContract
-  * Document with "SELL CONFIRMATION" title → SellContract
-  * Document with "CONFIRMATION" and "has sold" text → SellContract
-  * Document with "has bought" → BuyContract (NOT SellContract, even if filename says "Sell")
-
-DividendStatement
-- Keywords: "Dividend Statement", "Dividend Payment", "Record Date", "Payment Date"
-
-DistributionStatement
-- Keywords: "Distribution Statement/Advice", "Distribution Payment", "Net Distribution"
-- NOT a DistributionStatement if the document contains BUY CONFIRMATION keywords
-
-CapitalCallStatement
-- Keywords: "Capital Call", "Notice of Capital Call", "Amount Due"
-- ONLY if there is NO "Distribution" content
-
-CallAndDistributionStatement
-- Document includes BOTH Capital Call AND Distribution information
-
-HoldingStatement
-- Keywords: "CHESS", "HIN", "SRN", "Holdings", "Portfolio Summary", "Shareholding Statement"
-- NOT valid if trade confirmation keywords appear
-
-BankStatement
-- Keywords: "Bank Statement", account summary, BSB
-- NOT a bank statement if "confirmation", "contract note", "buy", "sell", "brokerage", "consideration" appear
-
-TaxStatement
-- Keywords: "Tax Statement", "AMIT", "AMMA", "Tax Summary", "NAV & Taxation Statement"
-
-NetAssetSummaryStatement
-- Keywords: "Net Asset Summary", "NAV Summary", "Fund Performance"
-- If NAV + tax info are both present → TaxStatement
-
-FinancialStatement
-- Keywords: "Financial Statements", "Financial Statement", "Directors' Report", "Directors Report", "Annual Report", "Audited Financial Statements", "Consolidated Financial Statements"
-- Look for patterns like: "DIRECTORS' REPORT AND FINANCIAL STATEMENTS", "FOR THE YEAR ENDED", "Financial Statements for the year ended"
-- This is a formal financial reporting document, NOT a periodic statement
-- If document contains "Financial Statements" or "Directors' Report" → FinancialStatement, NOT PeriodicStatement
-
-Other
-- Everything else
+    async def _dispatch(self, batch: List[Tuple[str, "asyncio.Future[Optional[Dict[str, Any]]]"]]) -> None:
+        texts = [text for text, _ in batch]
+        try:
+            if len(texts) == 1:
+                results = [await _extract_and_suggest_llm_async(texts[0], self.max_chars)]
+            else:
+                results = await _extract_and_suggest_packed_async(texts, self.max_chars)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
 
-------------------------------------------
-ISSUER EXTRACTION RULES
-------------------------------------------
-Issuer must be the FUND/PRODUCT/COMPANY from THIS document.
-
-For BuyContract/SellContract:
-- CRITICAL: You MUST extract the issuer/investment name. Returning null is NOT acceptable unless the document truly has no security information.
-- Extract the INVESTMENT/SECURITY name being bought/sold
-- Prioritise fields in THIS ORDER:
-  1. "COMPANY:" - HIGHEST PRIORITY (e.g., "COMPANY: CLEO DIAGNOSTICS LTD" → "CLEO DIAGNOSTICS LTD")
-  2. "Stock Description:" - HIGH PRIORITY for trade confirmations (e.g., "Stock Description: RUSSELL 2000 INDEX ISHARES" → "RUSSELL 2000 INDEX ISHARES")
-  3. "Security Description:" - PRIMARY field - Look for this in:
-     * Direct format: "Security Description: PERPETUAL DIVERSIFIED INCOME ACTIVE ETF"
-     * Table format: After "WE HAVE BOUGHT/SOLD THE FOLLOWING SECURITIES FOR YOU", find the table row with "Security Description" column
-     * Table row example: "Quantity 25,682 Security Code CRED Security Description BETASHARES AUS INVESTMENT GRADE CORPORATE BOND ETF Price 23.4603"
-       → Extract "BETASHARES AUS INVESTMENT GRADE CORPORATE BOND ETF"
-     * Table row example: "Quantity 39,260 Security Code DIFF Security Description PERPETUAL DIVERSIFIED INCOME ACTIVE ETF Price 10.1300"
-       → Extract "PERPETUAL DIVERSIFIED INCOME ACTIVE ETF"
-     * Extract the FULL name including "ETF", "FUND", "INDEX", "ISHARES" (e.g., "PERPETUAL DIVERSIFIED INCOME ACTIVE ETF", "BETASHARES AUS INVESTMENT GRADE CORPORATE BOND ETF")
-     * The Security Description is usually the longest text in the table row (not Quantity, not Price, not Code)
-  4. Look for security name in table rows - find the row that contains quantity, security code, and a long name (usually the investment name)
-  5. "Investment:", "Security:", "Code:" followed by security name
-- Remove unnecessary descriptors: "ORDINARY FULLY PAID", "FRN", "Callable", coupon details
-- BUT preserve ETF/index names: Keep "INDEX", "ISHARES", "ETF", "FUND" if present (e.g., "PERPETUAL DIVERSIFIED INCOME ACTIVE ETF" should remain complete)
-- DO NOT use broker names (CommSec, JBWere, Ord Minnett, Morgan Stanley, Equity & Super, EquitySuper) or investor names
-- CRITICAL: Do NOT extract legal disclaimers. If extracted name is very long (>100 chars) or contains phrases like "In Australia", "Liability", "Members", "Unless Otherwise Stated", reject it and look for actual investment name
-- CRITICAL: Do NOT extract "Quantity" or other table column headers - extract the actual investment name
-- CRITICAL: If you see a table with columns like "Quantity", "Security Code", "Security Description", "Price", "Consideration" - the investment name is in the "Security Description" column value
-
-For HoldingStatement/Share Summary/NetAssetSummaryStatement:
-- Extract the FUND name from the document TITLE (usually at the top of the document)
-- Look for patterns like: "FUND NAME Share Summary", "FUND NAME, Ltd. Share Summary", "FUND NAME NAV Statement"
-- Examples:
-  * "Highwest Global Offshore Fund, Ltd. Share Summary" → "Highwest Global Offshore Fund, Ltd."
-  * "ABC Investment Fund Share Summary" → "ABC Investment Fund"
-  * "XYZ Fund NAV Statement" → "XYZ Fund"
-- CRITICAL: Extract the ACTUAL FUND NAME, NOT the service provider name
-- DO NOT use service provider names like "Morgan Stanley Fund Services", "Computershare", "Link Market Services" - these are NOT the fund name
-- The fund name is usually the FIRST prominent name in the document title, before words like "Share Summary", "Statement", "NAV", etc.
-
-For DistributionStatement/Distribution Advice:
-- CRITICAL: Extract the ACTUAL FUND NAME, NOT the issuer/trustee/registry name
-- Look for fund name in THIS PRIORITY ORDER:
-  1. "Fund:" field - HIGHEST PRIORITY (e.g., "Fund: Ares Diversified Credit Fund - Class I" → "Ares Diversified Credit Fund - Class I")
-  2. Document title/header - Look for patterns like:
-     * "FUND NAME Distribution Statement"
-     * "FUND NAME Distribution Advice"
-     * "FUND NAME | ABN: ..." (fund name before ABN)
-  3. After "Distribution Statement" or "Distribution Advice" title, look for fund name in the same section
-  4. Look for fund name near "APIR Code" or fund identifiers
-- Examples of CORRECT extraction:
-  * "Ares Diversified Credit Fund - Class I" → "Ares Diversified Credit Fund - Class I"
-  * "Causeway Wholesale Private Debt Income Fund" → "Causeway Wholesale Private Debt Income Fund"
-  * "Fidante" or "AMAL CAUSEWAY TRUSTEES" → These are WRONG (these are issuers/trustees, not fund names)
-- DO NOT use:
-  * Issuer/Trustee names: "Fidante", "AMAL CAUSEWAY TRUSTEES", "Automic", "Computershare", "Link Market Services"
-  * Registry service names: "OIF Registry Services", "Automic Registry Services"
-  * Investor/recipient names
-  * Document labels: "Distribution Statement", "Distribution Advice"
-
-For DividendStatement:
-- Extract the fund/product/company name from document title or main content
-- Look for fund names in document headers or titles
-- Look for company name near "Dividend Statement" title
-- DO NOT use service provider or registry names - use the actual fund/company name
-
-For FinancialStatement:
-- Extract the COMPANY name from the document title/header
-- Look for patterns like: "COMPANY NAME DIRECTORS' REPORT AND FINANCIAL STATEMENTS"
-- Examples:
-  * "BIOSCEPTRE INTERNATIONAL LIMITED DIRECTORS' REPORT AND FINANCIAL STATEMENTS" → "BIOSCEPTRE INTERNATIONAL LIMITED"
-  * "ABC COMPANY LIMITED Financial Statements" → "ABC COMPANY LIMITED"
-- Extract the FULL company name including "LIMITED", "PTY LTD", etc. (do NOT remove suffixes for Financial Statements)
-- The company name is usually the FIRST prominent name in the document title, before "DIRECTORS' REPORT", "FINANCIAL STATEMENTS", etc.
-
-For other document types:
-- Extract the fund/product/company name from document title or main content
-- Look for fund names in document headers or titles
-- DO NOT use service provider or registry names - use the actual fund/company name
 
-------------------------------------------
-DATE EXTRACTION RULES
-------------------------------------------
-Output must be YYYY-MM-DD.
-Document dates use AU format (DD/MM/YYYY) - CRITICAL: Day comes FIRST, then month, then year.
-When you see "11/07/2025", this means: Day=11, Month=07 (July), Year=2025 → Output "2025-07-11"
-DO NOT confuse with MM/DD/YYYY format - in Australian documents, the FIRST number is always the DAY.
-
-Priority:
-
-DividendStatement:
-  Payment Date → Record Date → Statement Date
-
-DistributionStatement:
-  Payment Date → Record Date → Distribution Date
-
-BuyContract/SellContract:
-  CRITICAL: Use Trade Date or Confirmation Date, NOT Settlement Date
-  Priority order:
-  1. "Trade Date" - HIGHEST PRIORITY (e.g., "Trade Date: 09 May 2025" → "2025-05-09")
-  2. "Confirmation Date" - HIGH PRIORITY (e.g., "Confirmation Date: 11/07/2025" → "2025-07-11")
-  3. "Transaction Date" - MEDIUM PRIORITY
-  4. "Date" field in confirmation section
-  CRITICAL - DO NOT use:
-  - "Settlement Date" - This is a FUTURE date (usually 5-7 days after trade date)
-  - "ASX Settlement Date" - This is also a FUTURE date
-  - "Payment Date" - Wrong field
-  - Any date that is AFTER the trade/confirmation date
-  CRITICAL - Date Format Conversion:
-  - Australian dates are DD/MM/YYYY format (day first, month second)
-  - "11/07/2025" means 11th day of July (month 07), year 2025 → "2025-07-11"
-  - "15/07/2025" means 15th day of July (month 07), year 2025 → "2025-07-15"
-  - DO NOT confuse DD/MM/YYYY with MM/DD/YYYY - in Australia, day comes FIRST
-  Examples:
-  - Document shows "Confirmation date: 11/07/2025" and "Settlement date: 15/07/2025" → Use "2025-07-11" (Confirmation Date, NOT Settlement Date)
-  - Document shows "Trade Date: 09 May 2025" and "Settlement Date: 16 May 2025" → Use "2025-05-09" (Trade Date)
-  - Document shows "Confirmation Date: 13 Nov 2025" and "Settlement Date: 17 Nov 2025" → Use "2025-11-13" (Confirmation Date)
-
-FinancialStatement:
-  Year End Date → "FOR THE YEAR ENDED" date → Statement Date
-  Look for patterns like "FOR THE YEAR ENDED 30 JUNE 2025" → extract "2025-06-30"
-  Australian date format: DD/MM/YYYY or DD MMMM YYYY (e.g., "30 June 2025" → "2025-06-30")
-
-All others:
-  Statement Date or main document date
+# One batcher per max_chars, so every document in a pack is sampled the same way
+_BATCHERS: Dict[int, _LLMBatcher] = {}
 
-------------------------------------------
-FILENAME RULES
-------------------------------------------
-Filename format: YYYYMMDD - [doc-type-tag] - [issuer].pdf
-
-Date format: YYYYMMDD (no hyphens, no separators)
-- Convert YYYY-MM-DD to YYYYMMDD (e.g., "2025-11-13" → "20251113")
-
-Issuer rules:
-- Keep original capitalization and spaces
-- Remove suffixes (Pty Ltd, Pty. Ltd., Limited, Ltd) if present
-- for Buy/Sell: use the SECURITY name
-- do NOT include investor names
-- do NOT use broker names
-- Use dashes with spaces ( - ) to separate date, doc-type-tag, and issuer
-
-doc-type-tag mapping (use proper capitalization - first letter of each word):
-DividendStatement → Dividend Statement
-DistributionStatement → Distribution Statement
-CapitalCallStatement → Capital Call
-CallAndDistributionStatement → Distribution and Capital Call
-PeriodicStatement → Periodic Statement
-BankStatement → Bank Statement
-BuyContract → Buy Contract
-SellContract → Sell Contract
-HoldingStatement → Holding Statement
-TaxStatement → Tax Statement
-NetAssetSummaryStatement → Net Asset Summary
-FinancialStatement → Financial Statement
 
-------------------------------------------
-RETURN FORMAT
-------------------------------------------
-Return ONLY the JSON object.
-
-Do NOT include:
-- markdown
-- backticks
-- commentary
-- explanation
-- reasoning
-- extra text before or after the JSON
-
-Document text:
-{text_sample}
-
-JSON:"""
-
-    # Token limits: DeepSeek doesn't use reasoning tokens, GPT-5 Nano does
-    # For DeepSeek: 800 tokens is sufficient
-    # For GPT-5 Nano: 1500 tokens needed (400-500 reasoning + 800-1000 content)
-    max_tokens_value = 1500 if LLM_PROVIDER == "openai" else 800
-    response_text = _call_llm_api(prompt, max_tokens=max_tokens_value)
+def _get_batcher(max_chars: int) -> _LLMBatcher:
+    batcher = _BATCHERS.get(max_chars)
+    if batcher is None:
+        batcher = _BATCHERS[max_chars] = _LLMBatcher(max_chars, LLM_BATCH_WINDOW_MS / 1000, LLM_PACK_SIZE)
+    return batcher
+
+
+def _parse_extract_and_filename_response(response_text: Optional[str]) -> Optional[Dict[str, Any]]:
+    """Parse the combined extraction + filename JSON reply"""
     if not response_text:
         return None
     
-    # Extract JSON from response (handle markdown code blocks)
-    if "```json" in response_text:
-        response_text = response_text.split("```json")[1].split("```")[0].strip()
-    elif "```" in response_text:
-        response_text = response_text.split("```")[1].split("```")[0].strip()
-    
-    # Try to parse JSON
-    try:
-        extracted = json.loads(response_text)
-        # Validate and clean extracted data
-        result = {
-            "doc_type": extracted.get("doc_type") if extracted.get("doc_type") != "null" else None,
-            "issuer": extracted.get("issuer") if extracted.get("issuer") != "null" else None,
-            "date_iso": extracted.get("date_iso") if extracted.get("date_iso") != "null" else None,
-            "suggested_filename": extracted.get("suggested_filename") if extracted.get("suggested_filename") != "null" else None
-        }
-        return result
-    except json.JSONDecodeError as e:
-        print(f"LLM JSON parsing failed: {e}")
-        print(f"Response text (first 500 chars): {response_text[:500]}")
+    extracted = _extract_first_json(response_text)
+    if extracted is None:
+        logger.warning("LLM JSON parsing failed")
+        logger.debug("Response text (first 500 chars): %s", response_text[:500])
         return None
+    
+    result = _clean_extract_fields(extracted, _EXTRACT_AND_FILENAME_KEYS)
+    # The filename was built from the rejected issuer, so it goes too
+    if not result["issuer"] and extracted.get("issuer") not in (None,) + _NULL_VALUES:
+        result["suggested_filename"] = None
+    return result
 
 
 def suggest_filename_with_llm(fields: Dict[str, Optional[str]], text_sample: str = "") -> Optional[str]:
     """
-    Use LLM to suggest a better filename based on document context
-    LLM extracts everything directly from document text - ignores potentially incorrect fields
+    Deprecated: use extract_and_suggest_filename_with_llm
+    Returns the suggested_filename of the combined call; fields is ignored (the LLM reads the text itself)
     """
-    if not USE_LLM or not check_llm_available():
+    warnings.warn("suggest_filename_with_llm is deprecated, use extract_and_suggest_filename_with_llm", DeprecationWarning, stacklevel=2)
+    result = extract_and_suggest_filename_with_llm(text_sample) if text_sample else None
+    return result.get("suggested_filename") if result else None
+
+
+async def suggest_filename_with_llm_async(fields: Dict[str, Optional[str]], text_sample: str = "") -> Optional[str]:
+    """Deprecated: use extract_and_suggest_filename_with_llm_async"""
+    warnings.warn("suggest_filename_with_llm_async is deprecated, use extract_and_suggest_filename_with_llm_async", DeprecationWarning, stacklevel=2)
+    result = await extract_and_suggest_filename_with_llm_async(text_sample) if text_sample else None
+    return result.get("suggested_filename") if result else None
+
+
+async def suggest_filename_with_llm_batch(text_samples: List[str]) -> List[Optional[str]]:
+    """
+    Suggest filenames for several documents concurrently
+    Results are returned in the same order as text_samples
+    """
+    results = await asyncio.gather(*(extract_and_suggest_filename_with_llm_async(sample) for sample in text_samples))
+    return [result.get("suggested_filename") if result else None for result in results]
+
+
+# Ollama structured-output schemas, keyed by the system prefix that asks for them
+_NULLABLE_STRING = {"type": ["string", "null"]}
+_DOC_TYPE_SCHEMA = {"type": ["string", "null"], "enum": [t for t in _DOC_TYPES.split("|") if t != "null"] + [None]}
+_EXTRACT_SCHEMA = {
+    "type": "object",
+    "properties": {"doc_type": _DOC_TYPE_SCHEMA, "issuer": _NULLABLE_STRING, "date_iso": _NULLABLE_STRING},
+    "required": ["doc_type", "issuer", "date_iso"]
+}
+_OLLAMA_JSON_SCHEMAS: Dict[str, Dict[str, Any]] = {
+    _EXTRACT_PROMPT_PREFIX: _EXTRACT_SCHEMA,
+    _EXTRACT_AND_FILENAME_PROMPT_PREFIX: {
+        "type": "object",
+        "properties": {**_EXTRACT_SCHEMA["properties"], "suggested_filename": _NULLABLE_STRING},
+        "required": _EXTRACT_SCHEMA["required"] + ["suggested_filename"]
+    },
+    _EXTRACT_PACKED_PROMPT_PREFIX: {
+        "type": "object",
+        "properties": {"results": {"type": "array", "items": _EXTRACT_SCHEMA}},
+        "required": ["results"]
+    },
+    _ROUTER_PROMPT_PREFIX: {"type": "object", "properties": {"doc_type": _DOC_TYPE_SCHEMA}, "required": ["doc_type"]},
+}
+
+
+# OpenAI Batch API (bulk reprocessing at ~50% cost, results within 24 h)
+# Final statuses other than "completed"; every other status means the batch is still running
+_BATCH_FAILED_STATUSES = ("failed", "expired", "cancelled")
+
+
+def submit_extraction_batch(texts: List[str], max_chars: int = 1200) -> Optional[str]:
+    """
+    Upload an extraction request per text to the OpenAI Batch API
+    Returns the batch id, or None if the provider is not OpenAI or the upload failed
+    """
+    if LLM_PROVIDER != "openai" or not check_llm_available():
         return None
     
-    # Use more context from text for better filename generation (increase to 4000 chars to capture fund names)
-    context_sample = text_sample[:4000] if text_sample else ""
+    lines = []
+    for index, text in enumerate(texts):
+        _, _, payload = _build_llm_request(
+            _build_extract_prompt(text, max_chars), _JSON_MAX_TOKENS, _EXTRACT_PROMPT_PREFIX, json_mode=True
+        )
+        lines.append(_json_dumps({
+            "custom_id": str(index),
+            "method": "POST",
+            "url": "/v1/chat/completions",
+            "body": payload
+        }))
     
-    prompt = f"""You are helping to rename a financial document PDF file.
-
-IMPORTANT: Extract ALL information directly from the document text below. Do NOT rely on any pre-extracted fields - they may be incorrect.
+    headers = {"Authorization": f"Bearer {OPENAI_API_KEY}"}
+    try:
+        upload = _get_client().post(
+            f"{_OPENAI_BASE_URL}/files",
+            headers=headers,
+            data={"purpose": "batch"},
+            files={"file": ("extract.jsonl", b"\n".join(lines), "application/jsonl")},
+            timeout=120.0
+        )
+        if upload.status_code != 200:
+            logger.warning("OpenAI batch upload error: %s - %s", upload.status_code, upload.text)
+            return None
+        batch = _get_client().post(
+            f"{_OPENAI_BASE_URL}/batches",
+            headers={**headers, "Content-Type": "application/json"},
+            content=_json_dumps({
+                "input_file_id": _json_loads(upload.content)["id"],
+                "endpoint": "/v1/chat/completions",
+                "completion_window": "24h"
+            }),
+            timeout=30.0
+        )
+        if batch.status_code != 200:
+            logger.warning("OpenAI batch create error: %s - %s", batch.status_code, batch.text)
+            return None
+        return _json_loads(batch.content)["id"]
+    except Exception as e:
+        logger.warning("OpenAI batch submit error: %s", e)
+        return None
 
-FULL Document Context (read carefully and extract from here):
-{context_sample}
 
-------------------------------------------
-TOP PRIORITY RULES
-------------------------------------------
-1. Determine document type. If document contains "has bought", "bought for you", or "CONFIRMATION" + "BUY", it is BuyContract. If it contains "has sold", "sold for you", or "CONFIRMATION" + "SELL", it is SellContract.
-2. Extract the ACTUAL fund/product/investment name from THIS document's context
-3. For BuyContract/SellContract: Use INVESTMENT/SECURITY name, NOT broker name
-4. Return ONLY the filename. No explanation, no markdown, no backticks.
+def _batch_state(batch_id: str, status_response: httpx.Response) -> Tuple[bool, Optional[str]]:
+    """
+    Read a batch status response as (finished, output_file_id)
+    Anything short of a definite final status (HTTP errors included) means keep polling
+    """
+    if status_response.status_code != 200:
+        logger.warning("OpenAI batch %s status error: %s, will poll again", batch_id, status_response.status_code)
+        return False, None
+    batch = _json_loads(status_response.content)
+    status = batch.get("status")
+    if status == "completed" and batch.get("output_file_id"):
+        return True, batch["output_file_id"]
+    if status == "completed" or status in _BATCH_FAILED_STATUSES:
+        logger.warning("OpenAI batch %s ended with status %s", batch_id, status)
+        return True, None
+    return False, None
+
+
+def _parse_batch_output(content: bytes, count: int) -> List[Optional[Dict[str, Any]]]:
+    """Parse a batch output file (one JSON line per request) into results ordered by custom_id"""
+    results: List[Optional[Dict[str, Any]]] = [None] * count
+    for line in content.splitlines():
+        if not line.strip():
+            continue
+        try:
+            item = _json_loads(line)
+            body = (item.get("response") or {}).get("body") or {}
+            choices = body.get("choices") or [{}]
+            content_text = (choices[0].get("message") or {}).get("content", "")
+            results[int(item["custom_id"])] = _parse_extract_response(content_text.strip())
+        except (ValueError, KeyError, IndexError, TypeError, AttributeError) as e:
+            logger.warning("OpenAI batch output line skipped: %s", e)
+    return results
 
-------------------------------------------
-OUTPUT FORMAT (FILENAME MODE)
-------------------------------------------
-Return ONLY the filename in this format:
-
-YYYYMMDD - [doc-type-tag] - [issuer].pdf
-
-Date format: YYYYMMDD (no hyphens, no separators)
-- Convert YYYY-MM-DD to YYYYMMDD (e.g., "2025-11-13" → "20251113")
-
-Where:
-- issuer = keep original capitalization and spaces, remove "Pty Ltd", "Ltd", "Limited", "Pty. Ltd.", etc.
-- Use dashes with spaces ( - ) to separate date, doc-type-tag, and issuer
-- do NOT include investor/broker names
-- for BuyContract/SellContract: use INVESTMENT/SECURITY name (not broker)
-
-doc-type-tag mapping (use proper capitalization - first letter of each word):
-DividendStatement → Dividend Statement
-DistributionStatement → Distribution Statement
-CapitalCallStatement → Capital Call
-CallAndDistributionStatement → Distribution and Capital Call
-PeriodicStatement → Periodic Statement
-BankStatement → Bank Statement
-BuyContract → Buy Contract
-SellContract → Sell Contract
-HoldingStatement → Holding Statement
-TaxStatement → Tax Statement
-NetAssetSummaryStatement → Net Asset Summary
-FinancialStatement → Financial Statement
 
-------------------------------------------
-INVESTMENT NAME EXTRACTION (BuyContract/SellContract)
-------------------------------------------
-CRITICAL: Extract the INVESTMENT/SECURITY name being bought/sold from the document text.
-
-CRITICAL: You MUST extract the investment name. Returning null or "Unknown" is NOT acceptable unless the document truly has no security information.
-
-Look for fields in THIS PRIORITY ORDER:
-1. "COMPANY:" - HIGHEST PRIORITY (e.g., "COMPANY: CLEO DIAGNOSTICS LTD" → "CLEO DIAGNOSTICS")
-2. "Stock Description:" - HIGH PRIORITY (e.g., "Stock Description: RUSSELL 2000 INDEX ISHARES" → "RUSSELL 2000 INDEX ISHARES")
-3. "Security Description:" - PRIMARY field - Look in tables after "WE HAVE BOUGHT/SOLD THE FOLLOWING SECURITIES FOR YOU"
-   * Direct format: "Security Description: PERPETUAL DIVERSIFIED INCOME ACTIVE ETF" → "PERPETUAL DIVERSIFIED INCOME ACTIVE ETF"
-   * Table format: Look for table rows with columns: Quantity, Security Code, Security Description, Price, Consideration
-   * Table row example: "Quantity 25,682 Security Code CRED Security Description BETASHARES AUS INVESTMENT GRADE CORPORATE BOND ETF Price 23.4603"
-     → Extract "BETASHARES AUS INVESTMENT GRADE CORPORATE BOND ETF"
-   * Table row example: "Quantity 39,260 Security Code DIFF Security Description PERPETUAL DIVERSIFIED INCOME ACTIVE ETF Price 10.1300"
-     → Extract "PERPETUAL DIVERSIFIED INCOME ACTIVE ETF"
-   * Extract the FULL name including "ETF", "FUND", "INDEX", "ISHARES"
-   * The Security Description is usually the longest text in the table row (not Quantity, not Price, not Code)
-4. Look for security name patterns in transaction details tables
-5. "Investment:", "Code:" followed by security name
-
-Examples of CORRECT extraction:
-- "BETASHARES AUS INVESTMENT GRADE CORPORATE BOND ETF" → "BETASHARES AUS INVESTMENT GRADE CORPORATE BOND ETF"
-- "PERPETUAL DIVERSIFIED INCOME ACTIVE ETF" → "PERPETUAL DIVERSIFIED INCOME ACTIVE ETF"
-- "VANECK AUSTRALIAN SUBORDINATED DEBT ETF" → "VANECK AUSTRALIAN SUBORDINATED DEBT ETF"
-- "CLEO DIAGNOSTICS LTD" → "CLEO DIAGNOSTICS" (remove Ltd)
-- "RUSSELL 2000 INDEX ISHARES" → "RUSSELL 2000 INDEX ISHARES"
-- "BRAMBLES LIMITED" → "BRAMBLES" (remove Limited)
-
-CRITICAL - DO NOT use (these are WRONG):
-- Broker names: "Equity & Super", "EquitySuper", "CommSec", "JBWere", "Ord Minnett", "Morgan Stanley"
-- Investor names: "GENLIM PTY LTD", "D&M- SIMON CUNNINGTON", "DmSimonCunnington", "Simon Cunnington"
-- Document labels: "BUY CONFIRMATION", "SELL CONFIRMATION", "TAX INVOICE", "BuyConfirmation", "SellConfirmation", "TaxInvoice"
-- Document instructions: "Retain for taxation purposes", "RetainForTaxationPurposes"
-- Table column headers: "Quantity", "Currency", "Price", "Consideration", "Brokerage"
-- Transaction details: "Account No", "Confirmation No", "Trade Date", "Settlement Date", "Market", "Order Status", "HIN", "Adviser Name"
-- Legal disclaimers: Any text >100 chars or containing "In Australia", "Liability", etc.
-- ANY text that is NOT the actual investment/security name from the "Security Description" field
-
-If you see text like "DmSimonCunningtonBuyConfirmationTaxInvoiceRetainForTaxationPurposesEquitySuper", 
-this is WRONG - it's a mix of investor name, document labels, and broker name. 
-You MUST extract ONLY the investment name from "Security Description" field instead.
+def fetch_extraction_batch(batch_id: str, count: int) -> Optional[List[Optional[Dict[str, Any]]]]:
+    """
+    Fetch the results of a batch created by submit_extraction_batch
+    Returns None while the batch is still running or could not be polled; failed batches yield a list of None
+    """
+    headers = {"Authorization": f"Bearer {OPENAI_API_KEY}"}
+    try:
+        status_response = _get_client().get(f"{_OPENAI_BASE_URL}/batches/{batch_id}", headers=headers, timeout=30.0)
+        finished, output_file_id = _batch_state(batch_id, status_response)
+        if not finished:
+            return None
+        if not output_file_id:
+            return [None] * count
+        output = _get_client().get(f"{_OPENAI_BASE_URL}/files/{output_file_id}/content", headers=headers, timeout=120.0)
+    except (httpx.TransportError, ValueError) as e:
+        logger.warning("OpenAI batch %s poll error: %s, will poll again", batch_id, e)
+        return None
+    if output.status_code != 200:
+        logger.warning("OpenAI batch %s output error: %s, will poll again", batch_id, output.status_code)
+        return None
+    return _parse_batch_output(output.content, count)
 
-------------------------------------------
-FUND NAME EXTRACTION (Other Document Types)
-------------------------------------------
-For DistributionStatement/Distribution Advice:
-- CRITICAL: Extract the ACTUAL FUND NAME, NOT the issuer/trustee/registry name
-- Look for fund name in THIS PRIORITY ORDER:
-  1. "Fund:" field - HIGHEST PRIORITY (e.g., "Fund: Ares Diversified Credit Fund - Class I" → "Ares Diversified Credit Fund Class I")
-  2. Document title/header - Look for patterns like:
-     * "FUND NAME Distribution Statement" → extract FUND NAME
-     * "FUND NAME Distribution Advice" → extract FUND NAME
-     * "FUND NAME | ABN: ..." → extract FUND NAME (before ABN)
-  3. After "Distribution Statement" or "Distribution Advice" title, look for fund name in the same section
-  4. Look for fund name near "APIR Code" or fund identifiers
-- Examples of CORRECT extraction:
-  * "Ares Diversified Credit Fund - Class I" → "Ares Diversified Credit Fund Class I" (replace hyphens with spaces)
-  * "Causeway Wholesale Private Debt Income Fund" → "Causeway Wholesale Private Debt Income Fund"
-  * "Fidante" or "AMAL CAUSEWAY TRUSTEES" → These are WRONG (these are issuers/trustees, not fund names)
-- DO NOT use:
-  * Issuer/Trustee names: "Fidante", "AMAL CAUSEWAY TRUSTEES", "Automic", "Computershare", "Link Market Services"
-  * Registry service names: "OIF Registry Services", "Automic Registry Services"
-  * Investor/recipient names
-  * Document labels: "Distribution Statement", "Distribution Advice"
-
-For CapitalCallStatement/CallAndDistributionStatement:
-- Extract the FUND/PRODUCT name from document title FIRST
-- Look for patterns like "FUND NAME - CAPITAL CALL NOTICE" or "FUND NAME - DISTRIBUTION STATEMENT"
-- Extract the FULL fund name including "Fund", "Ventures", "Partnership", etc.
-- Do NOT use registry service names (e.g., "OIF Registry Services") - use the actual fund name
-
-For HoldingStatement/Share Summary/NetAssetSummaryStatement:
-- Extract the FUND name from the document TITLE (usually at the top of the document)
-- Look for patterns like: "FUND NAME Share Summary", "FUND NAME, Ltd. Share Summary", "FUND NAME NAV Statement"
-- Examples:
-  * "Highwest Global Offshore Fund, Ltd. Share Summary" → "Highwest Global Offshore Fund" (remove Ltd)
-  * "ABC Investment Fund Share Summary" → "ABC Investment Fund"
-  * "XYZ Fund NAV Statement" → "XYZ Fund"
-- CRITICAL: Extract the ACTUAL FUND NAME, NOT the service provider name
-- DO NOT use service provider names like "Morgan Stanley Fund Services", "Computershare", "Link Market Services" - these are NOT the fund name
-- The fund name is usually the FIRST prominent name in the document title, before words like "Share Summary", "Statement", "NAV", etc.
-- Remove suffixes like "Ltd.", "Limited", "Inc." when creating the slug, but keep the main fund name
-
-For FinancialStatement:
-- Extract the COMPANY name from the document title/header
-- Look for patterns like: "COMPANY NAME DIRECTORS' REPORT AND FINANCIAL STATEMENTS"
-- Examples:
-  * "BIOSCEPTRE INTERNATIONAL LIMITED DIRECTORS' REPORT AND FINANCIAL STATEMENTS" → "BIOSCEPTRE INTERNATIONAL LIMITED"
-  * "ABC COMPANY LIMITED Financial Statements" → "ABC COMPANY LIMITED"
-- Extract the FULL company name including "LIMITED", "PTY LTD", etc. (do NOT remove suffixes for Financial Statements)
-- The company name is usually the FIRST prominent name in the document title, before "DIRECTORS' REPORT", "FINANCIAL STATEMENTS", etc.
-
-For other document types:
-- Fund names after "Fund:", "Product:", "ETF:", or in document titles
-------------------------------------------
-DATE EXTRACTION
-------------------------------------------
-Extract from document context using these priorities:
-
-BuyContract/SellContract:
-  CRITICAL: Use Trade Date or Confirmation Date, NOT Settlement Date
-  Priority order:
-  1. "Trade Date" - HIGHEST PRIORITY (e.g., "Trade Date: 09 May 2025" → "2025-05-09")
-  2. "Confirmation Date" - HIGH PRIORITY (e.g., "Confirmation Date: 11/07/2025" → "2025-07-11")
-  3. "Transaction Date" - MEDIUM PRIORITY
-  4. "Date" field in confirmation section
-  CRITICAL - DO NOT use:
-  - "Settlement Date" - This is a FUTURE date (usually 5-7 days after trade date)
-  - "ASX Settlement Date" - This is also a FUTURE date
-  - "Payment Date" - Wrong field
-  - Any date that is AFTER the trade/confirmation date
-  CRITICAL - Date Format Conversion:
-  - Australian dates are DD/MM/YYYY format (day first, month second)
-  - "11/07/2025" means 11th day of July (month 07), year 2025 → "2025-07-11"
-  - "15/07/2025" means 15th day of July (month 07), year 2025 → "2025-07-15"
-  - DO NOT confuse DD/MM/YYYY with MM/DD/YYYY - in Australia, day comes FIRST
-  Examples:
-  - Document shows "Confirmation date: 11/07/2025" and "Settlement date: 15/07/2025" → Use "2025-07-11" (Confirmation Date, NOT Settlement Date)
-  - Document shows "Trade Date: 09 May 2025" and "Settlement Date: 16 May 2025" → Use "2025-05-09" (Trade Date)
-  - Document shows "Confirmation Date: 13 Nov 2025" and "Settlement Date: 17 Nov 2025" → Use "2025-11-13" (Confirmation Date)
-
-FinancialStatement:
-  Year End Date → "FOR THE YEAR ENDED" date → Statement Date
-  Look for patterns like "FOR THE YEAR ENDED 30 JUNE 2025" → extract "2025-06-30"
-  Australian date format: DD/MM/YYYY or DD MMMM YYYY (e.g., "30 June 2025" → "2025-06-30")
-
-DividendStatement:
-  Payment Date → Record Date → Statement Date
-
-DistributionStatement:
-  Payment Date → Record Date → Distribution Date
-
-All others:
-  Statement Date or document date
-
-Format for date_iso field: YYYY-MM-DD
-CRITICAL: Australian dates are DD/MM/YYYY format - Day comes FIRST, then month, then year.
-When you see "11/07/2025", this means: Day=11, Month=07 (July), Year=2025 → Output "2025-07-11"
-DO NOT confuse with MM/DD/YYYY format - in Australian documents, the FIRST number is always the DAY.
-Format for filename: YYYYMMDD (convert YYYY-MM-DD to YYYYMMDD, e.g., "2025-11-13" → "20251113")
 
-------------------------------------------
-RETURN FORMAT
-------------------------------------------
-Return ONLY the filename.
-
-Do NOT include:
-- markdown
-- backticks
-- commentary
-- explanation
-- reasoning
-- extra text before or after the filename
-
-Filename:"""
-
-    # Token limits: DeepSeek doesn't use reasoning tokens, GPT-5 Nano does
-    # For DeepSeek: 800 tokens is sufficient
-    # For GPT-5 Nano: 1500 tokens needed (400-500 reasoning + 800-1000 content)
-    max_tokens_value = 1500 if LLM_PROVIDER == "openai" else 800
-    response_text = _call_llm_api(prompt, max_tokens=max_tokens_value)
-    if not response_text:
+async def fetch_extraction_batch_async(batch_id: str, count: int) -> Optional[List[Optional[Dict[str, Any]]]]:
+    """Async variant of fetch_extraction_batch"""
+    headers = {"Authorization": f"Bearer {OPENAI_API_KEY}"}
+    try:
+        status_response = await _get_async_client().get(f"{_OPENAI_BASE_URL}/batches/{batch_id}", headers=headers, timeout=30.0)
+        finished, output_file_id = _batch_state(batch_id, status_response)
+        if not finished:
+            return None
+        if not output_file_id:
+            return [None] * count
+        output = await _get_async_client().get(f"{_OPENAI_BASE_URL}/files/{output_file_id}/content", headers=headers, timeout=120.0)
+    except (httpx.TransportError, ValueError) as e:
+        logger.warning("OpenAI batch %s poll error: %s, will poll again", batch_id, e)
         return None
+    if output.status_code != 200:
+        logger.warning("OpenAI batch %s output error: %s, will poll again", batch_id, output.status_code)
+        return None
+    return _parse_batch_output(output.content, count)
+
+
+def _next_poll_delay(delay: float, max_poll_interval: float, deadline: float) -> float:
+    """Double the poll delay up to max_poll_interval, never sleeping past the deadline"""
+    return max(0.0, min(delay * 2, max_poll_interval, deadline - time.monotonic()))
+
+
+def extract_with_llm_batch_api(
+    texts: List[str],
+    max_chars: int = 1200,
+    poll_interval: float = 30.0,
+    max_poll_interval: float = 600.0,
+    timeout: float = 86400.0
+) -> List[Optional[Dict[str, Any]]]:
+    """
+    Extract fields for a large backlog through the OpenAI Batch API (blocking)
+    Polls after poll_interval seconds, doubling the wait up to max_poll_interval
+    Documents handled by the deterministic fast path never leave the worker
+    """
+    results: List[Optional[Dict[str, Any]]] = [extract_fast(text) for text in texts]
+    pending = [index for index, result in enumerate(results) if result is None]
+    if not pending:
+        return results
     
-    # Extract filename from response - LLM might return explanation text
-    # Look for the actual filename pattern: YYYY-MM-DD_*.pdf or similar
-    import re
+    batch_id = submit_extraction_batch([texts[index] for index in pending], max_chars)
+    if not batch_id:
+        return results
     
-    # Try to find filename pattern in the response
-    filename_pattern = r'(\d{4}-\d{2}-\d{2}_[^\s]+\.pdf)'
-    match = re.search(filename_pattern, response_text)
+    deadline = time.monotonic() + timeout
+    delay = poll_interval / 2
+    batch_results = fetch_extraction_batch(batch_id, len(pending))
+    while batch_results is None and time.monotonic() < deadline:
+        delay = _next_poll_delay(delay, max_poll_interval, deadline)
+        time.sleep(delay)
+        batch_results = fetch_extraction_batch(batch_id, len(pending))
     
-    if match:
-        filename = match.group(1)
-    else:
-        # If no pattern found, try to extract last line or text before common phrases
-        # Remove common explanation prefixes
-        filename = response_text
-        # Remove explanation prefixes
-        for prefix in [
-            "Based on the document context",
-            "The filename should be",
-            "Here is the filename",
-            "Filename:",
-            "The suggested filename is",
-            "I extracted",
-            "Using the format"
-        ]:
-            if prefix.lower() in filename.lower():
-                # Extract text after the prefix
-                parts = filename.split(prefix, 1)
-                if len(parts) > 1:
-                    filename = parts[1].strip()
-                    # Remove any leading punctuation or bullets
-                    filename = re.sub(r'^[:\-\*\s]+', '', filename)
-                    break
-        
-        # Take first line if multiple lines
-        filename = filename.split('\n')[0].strip()
-        
-        # Remove quotes and clean up
-        filename = filename.replace('"', '').replace("'", "").strip()
-        
-        # Remove any trailing explanation text (look for common phrases)
-        explanation_markers = [
-            " based on",
-            " extracted from",
-            " using the",
-            " following the",
-            " according to"
-        ]
-        for marker in explanation_markers:
-            idx = filename.lower().find(marker.lower())
-            if idx > 0:
-                filename = filename[:idx].strip()
-                break
+    for index, result in zip(pending, batch_results or []):
+        results[index] = result
+    return results
+
+
+async def extract_with_llm_batch_api_async(
+    texts: List[str],
+    max_chars: int = 1200,
+    poll_interval: float = 30.0,
+    max_poll_interval: float = 600.0,
+    timeout: float = 86400.0
+) -> List[Optional[Dict[str, Any]]]:
+    """Async variant of extract_with_llm_batch_api (the upload runs in a worker thread)"""
+    results: List[Optional[Dict[str, Any]]] = [extract_fast(text) for text in texts]
+    pending = [index for index, result in enumerate(results) if result is None]
+    if not pending:
+        return results
     
-    # Final cleanup
-    filename = filename.strip()
+    batch_id = await asyncio.to_thread(submit_extraction_batch, [texts[index] for index in pending], max_chars)
+    if not batch_id:
+        return results
     
-    # Validate and return
-    if filename.endswith('.pdf'):
-        return filename
-    elif '.' not in filename and len(filename) > 0:
-        return f"{filename}.pdf"
-    elif len(filename) == 0:
-        return None
+    deadline = time.monotonic() + timeout
+    delay = poll_interval / 2
+    batch_results = await fetch_extraction_batch_async(batch_id, len(pending))
+    while batch_results is None and time.monotonic() < deadline:
+        delay = _next_poll_delay(delay, max_poll_interval, deadline)
+        await asyncio.sleep(delay)
+        batch_results = await fetch_extraction_batch_async(batch_id, len(pending))
     
-    return None
-
+    for index, result in zip(pending, batch_results or []):
+        results[index] = result
+    return results
@@ -5,6 +5,8 @@ Uses LLM for document classification and filename generation
 """
 
 import os
+import re
+import logging
 import hashlib
 import tempfile
 import shutil
@@ -19,23 +21,52 @@ from pydantic import BaseModel  # type: ignore
 # LLM helper
 try:
     from llm_helper import (
-        extract_with_llm,
-        suggest_filename_with_llm,
         extract_and_suggest_filename_with_llm,
+        extract_and_suggest_filename_with_llm_async,
+        extract_fast,
         check_llm_available,
-        check_ollama_available  # For backward compatibility
+        check_llm_available_async,
+        check_ollama_available,  # For backward compatibility
+        warm_up_llm_client,
+        aclose_llm_client,
+        USE_LLM,
+        doc_type_tag  # Readable doc-type tags for fallback filenames
     )
     LLM_AVAILABLE = True
 except ImportError:
     LLM_AVAILABLE = False
-    extract_with_llm = None
-    suggest_filename_with_llm = None
     extract_and_suggest_filename_with_llm = None
+    extract_and_suggest_filename_with_llm_async = None
+    extract_fast = None
     check_llm_available = lambda: False
+    check_llm_available_async = None
     check_ollama_available = lambda: False
+    warm_up_llm_client = None
+    aclose_llm_client = None
+    USE_LLM = False
+    # Without the helper module, just split the CamelCase type
+    doc_type_tag = lambda doc_type: re.sub(r"(?<=[a-z])(?=[A-Z])", " ", doc_type.replace("_", " ")).title()
+
+# Per-document progress is logged at DEBUG; set LOG_LEVEL=DEBUG to see it
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "WARNING").upper())
+logger = logging.getLogger(__name__)
 
 app = FastAPI(title="PDFsaver OCR Worker", version="2.0.0")
 
+
+@app.on_event("startup")
+async def startup_llm_client():
+    """Open LLM provider connections ahead of the first request"""
+    if warm_up_llm_client:
+        await warm_up_llm_client()
+
+
+@app.on_event("shutdown")
+async def shutdown_llm_client():
+    """Close pooled LLM provider connections"""
+    if aclose_llm_client:
+        await aclose_llm_client()
+
 # Configuration
 ALLOW_ORIGIN = os.getenv("ALLOW_ORIGIN", "http://localhost:3000")
 ALLOW_ORIGINS = os.getenv("ALLOW_ORIGINS", "")  # Comma-separated list of allowed origins
@@ -127,7 +158,7 @@ def run_ocr(input_path: str, output_path: str) -> bool:
         )
         return True
     except Exception as e:
-        print(f"OCR failed: {e}")
+        logger.warning("OCR failed: %s", e)
         return False
 
 
@@ -147,6 +178,26 @@ def extract_text_from_pdf(pdf_path: str, max_pages: int = 2) -> str:
     return text_content
 
 
+# Month to Num mapping (financial year starts in July)
+_MONTH_TO_NUM = {
+    7: "01",   # July
+    8: "02",   # Aug
+    9: "03",   # Sep
+    10: "04",  # Oct
+    11: "05",  # Nov
+    12: "06",  # Dec
+    1: "07",   # Jan
+    2: "08",   # Feb
+    3: "09",   # Mar
+    4: "10",   # Apr
+    5: "11",   # May
+    6: "12"    # Jun
+}
+
+# 8 consecutive digits (YYYYMMDD) in a filename
+_FILENAME_DATE_RE = re.compile(r'(\d{8})')
+
+
 def get_month_num(date_iso: str) -> str:
     """
     Get the Num based on the month of the date
@@ -171,23 +222,7 @@ def get_month_num(date_iso: str) -> str:
         else:
             return "00"
     
-    # Month to Num mapping
-    month_to_num = {
-        7: "01",   # July
-        8: "02",   # Aug
-        9: "03",   # Sep
-        10: "04",  # Oct
-        11: "05",  # Nov
-        12: "06",  # Dec
-        1: "07",   # Jan
-        2: "08",   # Feb
-        3: "09",   # Mar
-        4: "10",   # Apr
-        5: "11",   # May
-        6: "12"    # Jun
-    }
-    
-    return month_to_num.get(month, "00")
+    return _MONTH_TO_NUM.get(month, "00")
 
 
 def add_num_prefix(filename: str, date_iso: Optional[str]) -> str:
@@ -204,9 +239,8 @@ def add_num_prefix(filename: str, date_iso: Optional[str]) -> str:
     # If date_iso is not available or invalid, try to extract from filename
     if not date_to_use or date_to_use == "YYYY-MM-DD":
         # Try to extract YYYYMMDD from filename (format: YYYYMMDD - ... or Num YYYYMMDD - ...)
-        import re
         # Look for 8 consecutive digits (YYYYMMDD)
-        date_match = re.search(r'(\d{8})', filename)
+        date_match = _FILENAME_DATE_RE.search(filename)
         if date_match:
             date_str = date_match.group(1)
             # Convert YYYYMMDD to YYYY-MM-DD format for get_month_num
@@ -241,23 +275,9 @@ def build_fallback_filename(fields: Dict[str, Optional[str]]) -> str:
     
     doc_type = fields.get("doc_type") or "Unknown"
     # Convert doc_type to readable format with proper capitalization
-    doc_type_map = {
-        "DividendStatement": "Dividend Statement",
-        "DistributionStatement": "Distribution Statement",
-        "CapitalCallStatement": "Capital Call",
-        "CallAndDistributionStatement": "Distribution and Capital Call",
-        "PeriodicStatement": "Periodic Statement",
-        "BankStatement": "Bank Statement",
-        "BuyContract": "Buy Contract",
-        "SellContract": "Sell Contract",
-        "HoldingStatement": "Holding Statement",
-        "TaxStatement": "Tax Statement",
-        "NetAssetSummaryStatement": "Net Asset Summary",
-        "FinancialStatement": "Financial Statement"
-    }
-    doc_type_tag = doc_type_map.get(doc_type, doc_type.replace("_", " ").title())
+    type_tag = doc_type_tag(doc_type)
     
-    filename = f"{date} - {doc_type_tag} - {issuer}.pdf"
+    filename = f"{date} - {type_tag} - {issuer}.pdf"
     # Add Num prefix
     return add_num_prefix(filename, date_iso)
 
@@ -267,7 +287,7 @@ async def health_check():
     """Health check endpoint"""
     status = {"status": "ok"}
     if LLM_AVAILABLE:
-        status["llm_available"] = check_llm_available()
+        status["llm_available"] = await check_llm_available_async()
         if status["llm_available"]:
             llm_provider = os.getenv("LLM_PROVIDER", "ollama").lower()
             if llm_provider == "deepseek":
@@ -278,7 +298,7 @@ async def health_check():
                 status["llm_model"] = os.getenv("OPENAI_MODEL", "gpt-5-nano")
             else:
                 status["llm_provider"] = "ollama"
-                status["llm_model"] = os.getenv("OLLAMA_MODEL", "llama3")
+                status["llm_model"] = os.getenv("OLLAMA_MODEL", "qwen2.5:7b-instruct-q4_K_M")
     return status
 
 
@@ -355,17 +375,17 @@ async def ocr_extract(
         
         if has_text_layer:
             # PDF already has text layer, use it directly
-            print(f"PDF has text layer, skipping OCR for {file.filename}")
+            logger.debug("PDF has text layer, skipping OCR for %s", file.filename)
             text_content = initial_text
         else:
             # No text layer, run OCR
-            print(f"PDF lacks text layer, running OCR for {file.filename}")
+            logger.debug("PDF lacks text layer, running OCR for %s", file.filename)
             if run_ocr(temp_input, temp_output):
                 ocred = True
                 text_content = extract_text_from_pdf(temp_output, max_pages=2)
             else:
                 # OCR failed, try to use what we have
-                print(f"OCR failed, using original text for {file.filename}")
+                logger.warning("OCR failed, using original text for %s", file.filename)
                 text_content = initial_text
         
         # Check if we got sufficient text
@@ -377,7 +397,7 @@ async def ocr_extract(
         # Check cache
         if file_hash in _file_cache:
             cached_result = _file_cache[file_hash]
-            print(f"Cache hit for {file.filename}")
+            logger.debug("Cache hit for %s", file.filename)
             # Add Num prefix to cached filename
             cached_filename = add_num_prefix(
                 cached_result["suggested_filename"],
@@ -400,16 +420,17 @@ async def ocr_extract(
         suggested_filename = None
         
         # Use LLM for extraction and filename generation
-        if LLM_AVAILABLE and extract_and_suggest_filename_with_llm:
+        # USE_LLM is fixed at import: with the LLM off the helper module is never entered
+        if USE_LLM and extract_and_suggest_filename_with_llm_async:
             # Check if LLM is actually available
-            llm_available = check_llm_available()
-            print(f"LLM available check: {llm_available}, USE_LLM={os.getenv('USE_LLM')}, LLM_PROVIDER={os.getenv('LLM_PROVIDER')}")
+            llm_available = await check_llm_available_async()
+            logger.debug("LLM available check: %s, USE_LLM=%s, LLM_PROVIDER=%s", llm_available, os.getenv('USE_LLM'), os.getenv('LLM_PROVIDER'))
             if llm_available:
                 # Try combined LLM call first (faster - single HTTP request)
-                # Reduce text sample size for faster processing (2500 chars is usually enough)
-                print(f"Calling LLM for {file.filename}...")
-                combined_result = extract_and_suggest_filename_with_llm(text_content, max_chars=2500)
-                print(f"LLM result: {combined_result}")
+                # The helper trims the text to the document head plus a short tail
+                logger.debug("Calling LLM for %s...", file.filename)
+                combined_result = await extract_and_suggest_filename_with_llm_async(text_content)
+                logger.debug("LLM result: %s", combined_result)
                 if combined_result:
                     fields.update({
                         "doc_type": combined_result.get("doc_type"),
@@ -417,39 +438,22 @@ async def ocr_extract(
                         "date_iso": combined_result.get("date_iso")
                     })
                     suggested_filename = combined_result.get("suggested_filename")
-                    print(f"Extracted fields: {fields}, suggested_filename: {suggested_filename}")
+                    logger.debug("Extracted fields: %s, suggested_filename: %s", fields, suggested_filename)
             else:
-                print(f"LLM not available for {file.filename}. USE_LLM={os.getenv('USE_LLM')}, LLM_PROVIDER={os.getenv('LLM_PROVIDER')}")
+                logger.debug("LLM not available for %s. USE_LLM=%s, LLM_PROVIDER=%s", file.filename, os.getenv('USE_LLM'), os.getenv('LLM_PROVIDER'))
         else:
-            print(f"LLM_AVAILABLE={LLM_AVAILABLE}, extract_and_suggest_filename_with_llm={extract_and_suggest_filename_with_llm}")
-        
-        # Fallback: Use separate LLM calls if combined call not available or failed
-        if not suggested_filename and LLM_AVAILABLE:
-            llm_available = check_llm_available()
-            print(f"Fallback LLM check: llm_available={llm_available}")
-            if llm_available and extract_with_llm:
-                # Reduce text sample size for faster processing
-                print(f"Calling extract_with_llm for {file.filename}...")
-                llm_fields = extract_with_llm(text_content, max_chars=2500)
-                print(f"extract_with_llm result: {llm_fields}")
-            else:
-                llm_fields = None
-            if llm_fields:
-                fields.update(llm_fields)
-                print(f"Updated fields after extract_with_llm: {fields}")
-            
-            if llm_available and suggest_filename_with_llm:
-                print(f"Calling suggest_filename_with_llm for {file.filename}...")
-                llm_filename = suggest_filename_with_llm(fields, text_content[:2500])
-                print(f"suggest_filename_with_llm result: {llm_filename}")
-                if llm_filename:
-                    suggested_filename = llm_filename
+            logger.debug("LLM disabled or not installed (LLM_AVAILABLE=%s, USE_LLM=%s)", LLM_AVAILABLE, USE_LLM)
         
         # Final fallback: Build simple filename if LLM not available or failed
         if not suggested_filename:
-            print(f"Using fallback filename for {file.filename}. Fields: {fields}")
+            # The deterministic rules need no LLM, so they still apply when it is off or failed
+            if extract_fast and not fields.get("doc_type"):
+                rule_fields = extract_fast(text_content)
+                if rule_fields:
+                    fields.update(rule_fields)
+            logger.debug("Using fallback filename for %s. Fields: %s", file.filename, fields)
             suggested_filename = build_fallback_filename(fields)
-            print(f"Fallback filename generated: {suggested_filename}")
+            logger.debug("Fallback filename generated: %s", suggested_filename)
         
         # Add Num prefix to filename (for both LLM-generated and fallback filenames)
         suggested_filename = add_num_prefix(suggested_filename, fields.get("date_iso"))
@@ -480,10 +484,7 @@ async def ocr_extract(
     except HTTPException:
         raise
     except Exception as e:
-        import traceback
-        error_trace = traceback.format_exc()
-        print(f"OCR processing error: {str(e)}")
-        print(f"Traceback: {error_trace}")
+        logger.exception("OCR processing error: %s", e)
         raise HTTPException(status_code=500, detail=f"Processing error: {str(e)}")
     
     finally:
@@ -0,0 +1,148 @@
+import json
+import os
+import sys
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import llm_helper  # noqa: E402
+
+
+def test_scan_keywords_ignores_non_ascii_case_folds():
+    # Unicode case folding must not produce matches that have no label
+    for text in ("DİVİDEND STATEMENT", "Holder HİN 123", "haſ ſold", "dıvıdend statement"):
+        assert llm_helper.extract_fast(text) is None
+
+
+def test_scan_keywords_still_case_insensitive():
+    hits = llm_helper._scan_keywords("DIVIDEND STATEMENT\nHolder HIN 123\nWe have SOLD")
+    assert hits["DividendStatement"] == 1
+    assert hits["HolderHint"] == 1
+    assert hits["SellPhrase"] == 1
+
+
+def test_holder_ids_with_holdings_classify_as_holding_statement():
+    text = "Your CHESS holdings\nHIN: X0001234567\nFund: Example Global Fund\nStatement Date: 30/06/2025"
+    assert llm_helper.extract_fast(text) == {
+        "doc_type": "HoldingStatement", "issuer": "Example Global Fund", "date_iso": "2025-06-30"
+    }
+    # Holder ids alone still go to the LLM
+    assert llm_helper._classify_statement(llm_helper._scan_keywords("HIN: X0001234567")) is None
+
+
+def test_normalize_ocr_text_keeps_split_dates():
+    text = "Record Date\n30/06\n2025\nPeriod\n07/2025\nTotal\n1/2\nPage 3 of 4\n- 5 -\n"
+    assert llm_helper._normalize_ocr_text(text) == "Record Date\n30/06\n2025\nPeriod\n07/2025\nTotal"
+
+
+def test_issuer_blacklist_matches_whole_service_names():
+    assert llm_helper.extract_fast(
+        "Holding Statement\nFund: Morgan Stanley Global Opportunity Fund\nStatement Date: 30/06/2025"
+    )["issuer"] == "Morgan Stanley Global Opportunity Fund"
+    assert llm_helper._is_blacklisted_issuer("Link Market Services Ltd", "TaxStatement")
+    assert llm_helper._is_blacklisted_issuer("Computershare", "DividendStatement")
+    assert not llm_helper._is_blacklisted_issuer("COMPUTERSHARE LIMITED", "BuyContract")
+    # Broker names only disqualify the issuer of a trade
+    assert llm_helper._is_blacklisted_issuer("Morgan Stanley Wealth Management", "BuyContract")
+    assert not llm_helper._is_blacklisted_issuer("Fidante Ardea Real Outcome Fund", "DistributionStatement")
+
+
+def test_clean_extract_fields_drops_non_string_values():
+    cleaned = llm_helper._clean_extract_fields({"doc_type": {"x": 1}, "issuer": 42, "date_iso": ["2025-06-30"]})
+    assert cleaned == {"doc_type": None, "issuer": None, "date_iso": None}
+    cleaned = llm_helper._clean_extract_fields({"doc_type": "TaxStatement", "issuer": "null", "date_iso": "2025-06-30"})
+    assert cleaned == {"doc_type": "TaxStatement", "issuer": None, "date_iso": "2025-06-30"}
+
+
+def test_malformed_dates_never_reach_the_filename():
+    cleaned = llm_helper._clean_extract_fields({"doc_type": "TaxStatement", "issuer": "Acme", "date_iso": "30/06/2025"})
+    assert cleaned["date_iso"] is None
+    assert llm_helper._format_filename({"doc_type": "TaxStatement", "issuer": "Acme", "date_iso": 20250630}) is None
+    assert llm_helper._format_filename(
+        {"doc_type": "TaxStatement", "issuer": "Acme Pty Ltd", "date_iso": "2025-06-30"}
+    ) == "20250630 - Tax Statement - Acme.pdf"
+
+
+class _CharEncoding:
+    """One token per character, enough to exercise the token-space trimming"""
+    def encode(self, text, disallowed_special=()):
+        return list(text)
+
+    def decode(self, ids):
+        return "".join(ids)
+
+
+def test_trim_to_tokens_respects_small_budgets():
+    encoding = _CharEncoding()
+    assert llm_helper._trim_to_tokens("abcdefghij", 2, encoding) == "ab"
+    assert llm_helper._trim_to_tokens("abcdefghij", 6, encoding) == "abcd\n...\nij"
+    assert llm_helper._trim_to_tokens("abc", 6, encoding) == "abc"
+
+
+def test_condense_for_llm_matches_whole_triggers_and_cuts_at_line_breaks():
+    assert not llm_helper._CONTEXT_TRIGGER_RE.search("abnormal returns")
+    assert llm_helper._CONTEXT_TRIGGER_RE.search("ABN: 12 345 678 901")
+    assert llm_helper._CONTEXT_TRIGGER_RE.search("Company: Example Ltd")
+    lines = ["Title"] + ["filler %d" % i for i in range(20)] + ["Trade Date: 01/07/2025", "Settlement 03/07/2025"]
+    condensed = llm_helper._condense_for_llm("\n".join(lines), 40)
+    assert condensed == "Title\nfiller 0\nfiller 1\nfiller 2"
+
+
+def test_doc_type_tag():
+    assert llm_helper.doc_type_tag("CapitalCallStatement") == "Capital Call"
+    assert llm_helper.doc_type_tag("AnnualReport") == "Annual Report"
+
+
+def test_normalize_ocr_text_collapses_layout_noise():
+    text = "Dividend\t  Statement\f\n\n  Page 2\nDividend Statement\nDividend Statement\n2/3\nAmount   $1,000\n"
+    assert llm_helper._normalize_ocr_text(text) == "Dividend Statement\nAmount $1,000"
+
+
+def _ollama_chunk(content, done=False):
+    return json.dumps({"message": {"content": content}, "done": done})
+
+
+def test_json_stream_collector_stops_once_the_object_closes(monkeypatch):
+    monkeypatch.setattr(llm_helper, "LLM_PROVIDER", "ollama")
+    collector = llm_helper._JsonStreamCollector()
+    assert not collector.feed_line(_ollama_chunk('{"issuer": "A{B'))
+    assert not collector.feed_line(_ollama_chunk('} \\"Fund\\"", "meta": {"x": 1}'))
+    assert collector.feed_line(_ollama_chunk('}\n\nTrailing text'))
+    assert json.loads(collector.text.split("\n")[0]) == {"issuer": 'A{B} "Fund"', "meta": {"x": 1}}
+    # A reply that never closes its object stops on the provider's done flag
+    collector = llm_helper._JsonStreamCollector()
+    assert not collector.feed_line(_ollama_chunk('{"issuer": '))
+    assert collector.feed_line(_ollama_chunk("", done=True))
+
+
+def test_breaker_opens_after_failures_and_half_opens_after_cooldown(monkeypatch):
+    replies = []
+
+    def handler(request):
+        replies.append(request)
+        if len(replies) == 4:
+            return httpx.Response(200, json={"message": {"content": "ok"}, "done": True})
+        return httpx.Response(400, text="bad request")
+
+    monkeypatch.setattr(llm_helper, "LLM_PROVIDER", "ollama")
+    monkeypatch.setattr(llm_helper, "LLM_BREAKER_THRESHOLD", 2)
+    monkeypatch.setattr(llm_helper, "_BREAKER", {"fails": 0, "open_until": float("-inf")})
+    monkeypatch.setattr(llm_helper, "_CLIENT", httpx.Client(transport=httpx.MockTransport(handler)))
+
+    assert llm_helper._call_llm_api("breaker 1") is None
+    assert not llm_helper._breaker_open()
+    assert llm_helper._call_llm_api("breaker 2") is None
+    assert llm_helper._breaker_open()
+    # Open: calls are skipped without a request
+    assert llm_helper._call_llm_api("breaker 3") is None
+    assert len(replies) == 2
+    # Cooldown over: one failed trial call reopens it at once
+    llm_helper._BREAKER["open_until"] = float("-inf")
+    assert llm_helper._call_llm_api("breaker 4") is None
+    assert llm_helper._breaker_open()
+    # A successful trial call closes it
+    llm_helper._BREAKER["open_until"] = float("-inf")
+    assert llm_helper._call_llm_api("breaker 5") == "ok"
+    assert llm_helper._BREAKER["fails"] == 0
+    assert not llm_helper._breaker_open()
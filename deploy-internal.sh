@@ -34,7 +34,7 @@ NEXT_PUBLIC_APP_ORIGIN=http://$SERVER_IP:3000
 USE_LLM=false
 LLM_PROVIDER=ollama
 OLLAMA_URL=http://ollama:11434
-OLLAMA_MODEL=llama3
+OLLAMA_MODEL=qwen2.5:7b-instruct-q4_K_M
 EOF
     echo "✅ .env 文件已创建"
     echo ""
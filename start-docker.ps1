@@ -35,7 +35,7 @@ OCR_TOKEN=$token
 USE_LLM=false
 LLM_PROVIDER=ollama
 OLLAMA_URL=http://ollama:11434
-OLLAMA_MODEL=llama3
+OLLAMA_MODEL=qwen2.5:7b-instruct-q4_K_M
 "@ | Out-File -FilePath .env -Encoding utf8
     
     Write-Host "✅ 已创建 .env 文件，Token 已自动生成。" -ForegroundColor Green
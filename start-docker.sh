@@ -31,7 +31,7 @@ OCR_TOKEN=$(openssl rand -hex 32)
 USE_LLM=false
 LLM_PROVIDER=ollama
 OLLAMA_URL=http://ollama:11434
-OLLAMA_MODEL=llama3
+OLLAMA_MODEL=qwen2.5:7b-instruct-q4_K_M
 EOF
     echo "✅ 已创建 .env 文件，Token 已自动生成。"
     echo "⚠️  请检查 .env 文件并根据需要修改配置。"